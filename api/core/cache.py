@@ -0,0 +1,44 @@
+import time
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    cache ใน process แบบง่าย: ทุก entry หมดอายุเมื่อครบ ttl วินาที
+    (เป็นตาข่ายกันพลาด ตัวหลักคือให้ write endpoint เรียก invalidate)
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        self._entries.pop(key, None)
+        self.misses += 1
+        return MISSING
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, key=MISSING):
+        if key is MISSING:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl
+        }
@@ -15,5 +15,60 @@ COLLECTIONS = {
     "shifts": "shift_requests",
     "departments": "departments",
     "leaves": "leaves",
-    "line_sessions": "line_sessions"
+    "line_sessions": "line_sessions",
+    "outbox": "notification_outbox",
+    "line_events": "line_webhook_events",
+    "roster_days": "roster_days",
+    "counters": "counters"
 }
+
+# สร้าง index จาก api/core/indexes.py ตอน startup (idempotent)
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+# engine เริ่มต้นของ GET /shift-requests/table: "python", "pipeline" (aggregation)
+# หรือ "roster" (อ่านจาก roster_days; ต้อง rebuild ก่อนเปิดใช้ครั้งแรก)
+SHIFT_TABLE_ENGINE = os.getenv("SHIFT_TABLE_ENGINE", "python")
+
+# อายุ (วินาที) ของ cache โครงสร้างแผนกใน routers/departments.py
+DEPARTMENT_CACHE_TTL = float(os.getenv("DEPARTMENT_CACHE_TTL", "300"))
+
+# Cache-Control ของ GET ที่มี ETag (doctors, departments)
+# s-maxage > 0 จะให้ edge ของ Vercel cache response ได้ตามจำนวนวินาที
+HTTP_CACHE_S_MAXAGE = int(os.getenv("HTTP_CACHE_S_MAXAGE", "0"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "0"))
+
+# LINE Messaging API (ชี้ LINE_API_BASE_URL ไปที่ stub server ตอนทดสอบได้)
+LINE_API_BASE_URL = os.getenv("LINE_API_BASE_URL", "https://api.line.me")
+LINE_HTTP_TIMEOUT = float(os.getenv("LINE_HTTP_TIMEOUT", "10"))
+LINE_HTTP_CONNECT_TIMEOUT = float(os.getenv("LINE_HTTP_CONNECT_TIMEOUT", "3"))
+LINE_HTTP_MAX_CONNECTIONS = int(os.getenv("LINE_HTTP_MAX_CONNECTIONS", "20"))
+LINE_HTTP_MAX_KEEPALIVE = int(os.getenv("LINE_HTTP_MAX_KEEPALIVE", "10"))
+# replyToken ใช้ได้ภายในเวลาจำกัดหลัง event (เผื่อ margin ไว้) เกินนี้จะ push แทน
+LINE_REPLY_TOKEN_TTL = float(os.getenv("LINE_REPLY_TOKEN_TTL", "50"))
+
+# notification outbox (api/services/outbox.py)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "5"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "30"))
+# รัน dispatcher เป็น asyncio task ใน process ของ API (เปิดเฉพาะ host ที่รันค้างได้ ไม่ใช่ Vercel)
+OUTBOX_DISPATCHER_ENABLED = os.getenv("OUTBOX_DISPATCHER_ENABLED", "false").lower() == "true"
+
+# de-dup webhook event ด้วย webhookEventId: LRU ใน process + collection ที่มี TTL
+LINE_EVENT_DEDUP_TTL = int(os.getenv("LINE_EVENT_DEDUP_TTL", str(3 * 24 * 3600)))
+LINE_EVENT_LRU_SIZE = int(os.getenv("LINE_EVENT_LRU_SIZE", "10000"))
+
+# session ของบทสนทนา LINE: "mongo" หรือ "memory"; session ที่เงียบเกิน TTL จะหมดอายุ
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "mongo")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# identity index ของแพทย์ใน process (api/services/doctor_index.py)
+DOCTOR_INDEX_REFRESH_SECONDS = float(os.getenv("DOCTOR_INDEX_REFRESH_SECONDS", "30"))
+DOCTOR_INDEX_FULL_RELOAD_SECONDS = float(os.getenv("DOCTOR_INDEX_FULL_RELOAD_SECONDS", "600"))
+# refresh รอบถัดไปย้อนจาก updated_at ล่าสุดที่อ่านได้เท่านี้ (กันนาฬิกาของแต่ละ instance ไม่ตรงกัน)
+DOCTOR_INDEX_REFRESH_OVERLAP_SECONDS = float(os.getenv("DOCTOR_INDEX_REFRESH_OVERLAP_SECONDS", "5"))
+
+# POST /shift-requests/bulk: จำนวนเอกสารต่อ insert_many
+SHIFT_BULK_CHUNK_SIZE = int(os.getenv("SHIFT_BULK_CHUNK_SIZE", "500"))
@@ -1,7 +1,9 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 from api.core.config import MONGO_URI, DB_NAME, COLLECTIONS
 
-client = MongoClient(MONGO_URI)
+# AsyncMongoClient เชื่อมต่อแบบ lazy และคุม connection pool เอง
+# handler ทุกตัวจึงเป็น async def และ await การเรียก Mongo แทนการกิน threadpool
+client = AsyncMongoClient(MONGO_URI)
 db = client[DB_NAME]
 
 doctor_collection = db[COLLECTIONS["doctors"]]
@@ -9,3 +11,20 @@ shift_collection = db[COLLECTIONS["shifts"]]
 department_collection = db[COLLECTIONS["departments"]]
 leave_collection = db[COLLECTIONS["leaves"]]
 session_collection  = db[COLLECTIONS["line_sessions"]]
+outbox_collection = db[COLLECTIONS["outbox"]]
+line_event_collection = db[COLLECTIONS["line_events"]]
+roster_collection = db[COLLECTIONS["roster_days"]]
+counter_collection = db[COLLECTIONS["counters"]]
+
+
+async def run_in_transaction(callback):
+    """
+    รัน callback(session) ใน transaction เดียว (ต้องเป็น replica set / Atlas)
+    with_transaction retry ทั้ง callback เองเมื่อเจอ error ชั่วคราว → callback ต้องรันซ้ำได้
+    """
+    async with client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+async def close_client():
+    await client.close()
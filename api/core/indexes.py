@@ -0,0 +1,181 @@
+"""
+Index registry ของทุก collection
+
+ประกาศ index ไว้ที่เดียว แล้ว apply แบบ idempotent ตอน startup
+หรือสั่งเองจาก CLI:
+
+    python -m api.core.indexes apply
+    python -m api.core.indexes report
+"""
+import asyncio
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from api.core.config import COLLECTIONS, LINE_EVENT_DEDUP_TTL, OUTBOX_RETENTION_DAYS, SESSION_TTL_SECONDS
+from api.core.database import db
+
+# key = ชื่อใน COLLECTIONS, value = index ที่ query ใน routers ต้องใช้
+INDEXES = {
+    "doctors": [
+        # webhook: find_one({"care_provider_code": ...})
+        IndexModel([("care_provider_code", ASCENDING)], name="care_provider_code_1"),
+        # webhook: find_one({"line_id": ...})
+        IndexModel([("line_id", ASCENDING)], name="line_id_1", sparse=True),
+        # doctor_index: refresh เฉพาะแพทย์ที่แก้ไขหลังรอบก่อน
+        IndexModel([("updated_at", ASCENDING)], name="updated_at_1", sparse=True),
+    ],
+    "shifts": [
+        # get_shift_table: ipus + department (equality) → date (range) → status
+        IndexModel(
+            [("ipus", ASCENDING), ("department", ASCENDING), ("date", ASCENDING), ("status", ASCENDING)],
+            name="ipus_1_department_1_date_1_status_1",
+        ),
+        # get_shift_requests: filter status แล้ว sort date
+        IndexModel([("status", ASCENDING), ("date", ASCENDING)], name="status_1_date_1"),
+        IndexModel([("date", ASCENDING)], name="date_1"),
+        # ตัวเดียวกันบน BSON date (date_on) หลัง migrate; index string เดิมยังต้องมีจนกว่าจะ migrate ครบ
+        IndexModel(
+            [("ipus", ASCENDING), ("department", ASCENDING), ("date_on", ASCENDING), ("status", ASCENDING)],
+            name="ipus_1_department_1_date_on_1_status_1",
+        ),
+        IndexModel([("date_on", ASCENDING)], name="date_on_1"),
+    ],
+    "departments": [
+        # get_department_structure / sort ตามชื่อแผนก
+        IndexModel([("department", ASCENDING)], name="department_1"),
+    ],
+    "leaves": [
+        # get_shift_table: leave ที่ matched และทับช่วงวันที่
+        IndexModel(
+            [("status", ASCENDING), ("ipus", ASCENDING), ("department", ASCENDING),
+             ("start_date", ASCENDING), ("end_date", ASCENDING)],
+            name="status_1_ipus_1_department_1_start_date_1_end_date_1",
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("ipus", ASCENDING), ("department", ASCENDING),
+             ("start_on", ASCENDING), ("end_on", ASCENDING)],
+            name="status_1_ipus_1_department_1_start_on_1_end_on_1",
+        ),
+        # get_leaves: sort created_at ล่าสุดก่อน
+        IndexModel([("created_at", DESCENDING)], name="created_at_-1"),
+        # get_by_doctor
+        IndexModel([("doctor_id", ASCENDING), ("created_at", DESCENDING)], name="doctor_id_1_created_at_-1"),
+    ],
+    "line_sessions": [
+        # session_store: find_one_and_update + upsert ต้อง unique ไม่งั้นได้ session ซ้ำตอนแข่งกัน
+        IndexModel([("user_id", ASCENDING)], name="user_id_1_unique", unique=True),
+        # session ที่ไม่มีความเคลื่อนไหวเกิน SESSION_TTL_SECONDS หมดอายุ
+        IndexModel(
+            [("updated_at", ASCENDING)],
+            name="updated_at_1",
+            expireAfterSeconds=SESSION_TTL_SECONDS,
+        ),
+    ],
+    "outbox": [
+        # dispatcher: รายการที่ถึงเวลาส่ง เรียงตาม next_attempt_at
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_1_next_attempt_at_1"),
+        # ลบรายการที่ส่งสำเร็จแล้วหลังครบ OUTBOX_RETENTION_DAYS (รายการ failed ไม่มี sent_at จึงเก็บไว้)
+        IndexModel(
+            [("sent_at", ASCENDING)],
+            name="sent_at_1",
+            expireAfterSeconds=OUTBOX_RETENTION_DAYS * 24 * 3600,
+        ),
+    ],
+    "line_events": [
+        # _id = webhookEventId; ลบทิ้งเมื่อพ้นช่วงที่ LINE อาจส่งซ้ำ
+        IndexModel(
+            [("received_at", ASCENDING)],
+            name="received_at_1",
+            expireAfterSeconds=LINE_EVENT_DEDUP_TTL,
+        ),
+    ],
+    "roster_days": [
+        # 1 document ต่อวัน: refresh ใช้ key นี้ upsert, get_shift_table(engine=roster) ใช้ range บน date
+        # unique จำเป็นต่อ version guard ใน refresh_roster (upsert ที่ snapshot เก่ากว่าต้องชน duplicate)
+        IndexModel(
+            [("ipus", ASCENDING), ("department", ASCENDING), ("date", ASCENDING)],
+            name="ipus_1_department_1_date_1_unique",
+            unique=True,
+        ),
+    ],
+}
+
+
+def _key(spec):
+    return tuple((field, int(direction)) for field, direction in spec.items())
+
+
+async def ensure_indexes():
+    """
+    สร้าง index ที่ประกาศไว้ (createIndexes ข้ามตัวที่มีอยู่แล้ว)
+    สร้างทีละ index: ตัวที่สร้างไม่ได้ (เช่น index เดิม key เดียวกันแต่ option ต่างกัน
+    หรือข้อมูลซ้ำกับ unique index) ไม่พาตัวอื่นใน collection เดียวกันล้มไปด้วย
+    คืน {collection: {"created": [...], "errors": {ชื่อ index: ข้อความ}}}
+    """
+    results = {}
+    for name, models in INDEXES.items():
+        collection = db[COLLECTIONS[name]]
+        result = results[name] = {"created": [], "errors": {}}
+        for model in models:
+            try:
+                result["created"] += await collection.create_indexes([model])
+            except OperationFailure as e:
+                result["errors"][model.document["name"]] = e.details.get("errmsg", str(e)) if e.details else str(e)
+    return results
+
+
+def index_errors(results) -> list:
+    """แปลงผลของ ensure_indexes เป็นบรรทัด error (ว่าง = สร้างครบ)"""
+    return [
+        f"{name}.{index}: {message}"
+        for name, result in results.items()
+        for index, message in result["errors"].items()
+    ]
+
+
+async def index_report():
+    """
+    รายงานต่อ collection:
+    - missing: index ที่ประกาศไว้แต่ยังไม่มีใน DB
+    - unused:  index ใน DB ที่ไม่เคยถูกใช้ตั้งแต่ mongod start ($indexStats)
+    - undeclared: index ใน DB ที่ไม่ได้อยู่ใน registry
+    """
+    report = {}
+    for name, models in INDEXES.items():
+        collection = db[COLLECTIONS[name]]
+        existing = await collection.index_information()
+        existing_keys = {tuple((f, int(d)) for f, d in info["key"]): idx
+                         for idx, info in existing.items()}
+
+        declared_keys = {_key(m.document["key"]): m.document["name"] for m in models}
+
+        cursor = await collection.aggregate([{"$indexStats": {}}])
+        usage = {s["name"]: s["accesses"]["ops"] async for s in cursor}
+
+        report[name] = {
+            "missing": [n for k, n in declared_keys.items() if k not in existing_keys],
+            "unused": [n for n, ops in usage.items() if ops == 0 and n != "_id_"],
+            "undeclared": [n for k, n in existing_keys.items()
+                           if k not in declared_keys and n != "_id_"],
+        }
+    return report
+
+
+async def _main(command):
+    if command == "apply":
+        results = await ensure_indexes()
+        for name, result in results.items():
+            print(f"{name}: {', '.join(result['created'])}")
+        for line in index_errors(results):
+            print(f"error: {line}")
+    elif command == "report":
+        for name, r in (await index_report()).items():
+            print(f"{name}: missing={r['missing']} unused={r['unused']} undeclared={r['undeclared']}")
+    else:
+        raise SystemExit("usage: python -m api.core.indexes [apply|report]")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "report"))
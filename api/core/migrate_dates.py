@@ -0,0 +1,74 @@
+"""
+Migration: เก็บวันที่เป็น BSON date คู่กับ string เดิม
+
+    shift_requests.date       → date_on
+    leaves.start_date/end_date → start_on / end_on
+
+writer ใหม่เขียนทั้งสอง field แล้ว; query ใน routers อ่านได้ทั้งสองแบบ (dual_date_query)
+migration นี้เติมให้ document เก่าที่ยังไม่มี field ใหม่ (idempotent, รันซ้ำได้)
+
+    python -m api.core.migrate_dates status
+    python -m api.core.migrate_dates apply
+"""
+import asyncio
+import sys
+
+from api.core.database import shift_collection, leave_collection
+
+ISO_DATE = r"^\d{4}-\d{2}-\d{2}$"
+
+# collection → {field ใหม่: field string เดิม}
+DATE_FIELDS = {
+    "shifts": (shift_collection, {"date_on": "date"}),
+    "leaves": (leave_collection, {"start_on": "start_date", "end_on": "end_date"}),
+}
+
+
+def _pending(fields: dict) -> dict:
+    """document ที่ยังไม่มี field ใหม่ตัวใดตัวหนึ่ง และ string เดิมเป็น YYYY-MM-DD ครบ"""
+    return {
+        "$or": [{native: {"$exists": False}} for native in fields],
+        **{text: {"$regex": ISO_DATE} for text in fields.values()}
+    }
+
+
+async def migration_status():
+    return {
+        name: await collection.count_documents(_pending(fields))
+        for name, (collection, fields) in DATE_FIELDS.items()
+    }
+
+
+async def migrate_dates():
+    """แปลงฝั่ง server ด้วย update แบบ pipeline ($dateFromString) ครั้งเดียวต่อ collection"""
+    migrated = {}
+    for name, (collection, fields) in DATE_FIELDS.items():
+        result = await collection.update_many(
+            _pending(fields),
+            [{"$set": {
+                # วันที่ที่ไม่มีจริง (เช่น 2024-02-30) → ไม่เขียน field ใหม่ ยังอ่านผ่าน string เดิมได้
+                native: {"$dateFromString": {
+                    "dateString": f"${text}",
+                    "format": "%Y-%m-%d",
+                    "onError": "$$REMOVE"
+                }}
+                for native, text in fields.items()
+            }}]
+        )
+        migrated[name] = result.modified_count
+    return migrated
+
+
+async def _main(command):
+    if command == "apply":
+        for name, count in (await migrate_dates()).items():
+            print(f"{name}: migrated {count}")
+    elif command == "status":
+        for name, count in (await migration_status()).items():
+            print(f"{name}: pending {count}")
+    else:
+        raise SystemExit("usage: python -m api.core.migrate_dates [status|apply]")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "status"))
@@ -1,9 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.routers import doctors, shifts, departments, leaves, line
+from api.core.config import ENSURE_INDEXES_ON_STARTUP, OUTBOX_DISPATCHER_ENABLED
+from api.core.database import close_client
+from api.core.indexes import ensure_indexes, index_errors
+from api.services.line_service import close_line_client
+from api.services.outbox import run_dispatcher
+from api.routers import doctors, shifts, departments, leaves, line, outbox
+from api.routers.line import line_events
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ENSURE_INDEXES_ON_STARTUP:
+        # index ที่สร้างไม่ได้ไม่หยุด startup แต่ต้องเห็นใน log
+        # (เช่น session ซ้ำจากก่อนมี unique index → ต้องลบซ้ำแล้วรัน python -m api.core.indexes apply)
+        for line in index_errors(await ensure_indexes()):
+            print("ensure_indexes error:", line)
+
+    dispatcher = asyncio.create_task(run_dispatcher()) if OUTBOX_DISPATCHER_ENABLED else None
+
+    yield
+
+    await line_events.drain()
+    if dispatcher:
+        dispatcher.cancel()
+    await close_line_client()
+    await close_client()
+
 
-app = FastAPI(title="BUD Doctor API")
+app = FastAPI(title="BUD Doctor API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,10 +40,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 app.include_router(doctors.router)
 app.include_router(shifts.router)
 app.include_router(departments.router)
 app.include_router(leaves.router)
-app.include_router(line.router)
\ No newline at end of file
+app.include_router(line.router)
+app.include_router(outbox.router)
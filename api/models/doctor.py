@@ -31,3 +31,16 @@ class Doctor(BaseModel):
     }
 
     status: Optional[str] = None
+
+
+# ชุด field สำเร็จรูปสำหรับ ?fields= (ทุกชื่อต้องเป็น field ของ Doctor)
+DOCTOR_FIELD_PRESETS = {
+    "summary": [
+        "thai_title", "thai_first_name", "thai_last_name", "thai_full_name",
+        "care_provider_code", "ipus", "department",
+    ],
+    "contact": [
+        "thai_title", "thai_first_name", "thai_last_name", "thai_full_name",
+        "phone", "line_id", "email",
+    ],
+}
@@ -25,4 +25,9 @@ class LeaveRequest(BaseModel):
     reason: Optional[str] = None
 
     status: Optional[str] = "pending"
-    created_at: Optional[datetime] = None
\ No newline at end of file
+    created_at: Optional[datetime] = None
+
+
+class BulkLeaveDecision(BaseModel):
+    ids: List[str]
+    approver_name: str
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 
 class ShiftRequest(BaseModel):
     doctor_id: str
@@ -14,3 +14,8 @@ class ShiftRequest(BaseModel):
     start_time: Optional[str] = None
     end_time: Optional[str] = None
     remark: Optional[str] = None
+
+
+class BulkStatusUpdate(BaseModel):
+    ids: List[str]
+    status: str
@@ -1,85 +1,110 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from bson import ObjectId
 
+from api.core.cache import TTLCache, MISSING
+from api.core.config import DEPARTMENT_CACHE_TTL
 from api.core.database import department_collection
 from api.models.department import Department, SubDepartment, Shift
 from api.utils.helpers import department_helper
+from api.utils.responses import etag_response
+from api.utils.writes import insert_and_return, update_and_return
 
 router = APIRouter(prefix="/departments", tags=["Departments"])
 
+# โครงสร้างแผนกแทบไม่เปลี่ยน → cache ไว้ ทุก write endpoint ต้อง invalidate
+# key: ALL_DEPARTMENTS = list ทั้งหมด, ("structure", ชื่อแผนก) = structure ของแผนกนั้น
+department_cache = TTLCache(DEPARTMENT_CACHE_TTL)
+ALL_DEPARTMENTS = ("all",)
+
 @router.post("")
-def create_department(payload: Department):
+async def create_department(payload: Department):
     doc = payload.dict(by_alias=True, exclude={"id"})
-    result = department_collection.insert_one(doc)
-    return department_helper(
-        department_collection.find_one({"_id": result.inserted_id})
-    )
+    doc = await insert_and_return(department_collection, doc)
+    department_cache.invalidate()
+    return department_helper(doc)
 
 @router.get("")
-def get_departments():
-    return [
-        department_helper(d)
-        for d in department_collection.find().sort("department", 1)
-    ]
+async def get_departments(request: Request):
+    departments = department_cache.get(ALL_DEPARTMENTS)
+    if departments is MISSING:
+        departments = department_cache.set(ALL_DEPARTMENTS, [
+            department_helper(d)
+            async for d in department_collection.find().sort("department", 1)
+        ])
+
+    return etag_response(request, departments)
+
+@router.get("/cache/stats")
+def get_department_cache_stats():
+    return department_cache.stats()
 
 @router.get("/{department_id}")
-def get_department(department_id: str):
-    doc = department_collection.find_one({"_id": ObjectId(department_id)})
+async def get_department(department_id: str, request: Request):
+    doc = await department_collection.find_one({"_id": ObjectId(department_id)})
     if not doc:
         raise HTTPException(404, "Department not found")
-    return department_helper(doc)
+    return etag_response(request, department_helper(doc))
 
 @router.put("/{department_id}")
-def update_department(department_id: str, payload: Department):
+async def update_department(department_id: str, payload: Department):
     data = payload.dict(by_alias=True, exclude={"id"})
-    result = department_collection.update_one(
+    doc = await update_and_return(
+        department_collection,
         {"_id": ObjectId(department_id)},
         {"$set": data}
     )
-    if result.matched_count == 0:
+    department_cache.invalidate()
+    if not doc:
         raise HTTPException(404, "Department not found")
-    return department_helper(
-        department_collection.find_one({"_id": ObjectId(department_id)})
-    )
+    return department_helper(doc)
 
 @router.delete("/{department_id}")
-def delete_department(department_id: str):
-    result = department_collection.delete_one({"_id": ObjectId(department_id)})
+async def delete_department(department_id: str):
+    result = await department_collection.delete_one({"_id": ObjectId(department_id)})
+    department_cache.invalidate()
     if result.deleted_count == 0:
         raise HTTPException(404, "Department not found")
     return {"message": "Department deleted successfully"}
 
 @router.patch("/{department_id}/sub-departments")
-def add_sub_department(department_id: str, payload: SubDepartment):
-    department_collection.update_one(
+async def add_sub_department(department_id: str, payload: SubDepartment):
+    doc = await update_and_return(
+        department_collection,
         {"_id": ObjectId(department_id)},
         {"$push": {"sub_departments": payload.dict()}}
     )
-    return department_helper(
-        department_collection.find_one({"_id": ObjectId(department_id)})
-    )
+    department_cache.invalidate()
+    if not doc:
+        raise HTTPException(404, "Department not found")
+    return department_helper(doc)
 
 @router.patch("/{department_id}/sub-departments/{sub_name}/shifts")
-def add_shift(department_id: str, sub_name: str, payload: Shift):
-    department_collection.update_one(
+async def add_shift(department_id: str, sub_name: str, payload: Shift):
+    doc = await update_and_return(
+        department_collection,
         {
             "_id": ObjectId(department_id),
             "sub_departments.name": sub_name
         },
         {"$push": {"sub_departments.$.shifts": payload.dict()}}
     )
-    return department_helper(
-        department_collection.find_one({"_id": ObjectId(department_id)})
-    )
+    department_cache.invalidate()
+    if not doc:
+        raise HTTPException(404, "Department or sub-department not found")
+    return department_helper(doc)
 
 @router.get("/{department_name}/structure")
-def get_department_structure(department_name: str):
-    doc = department_collection.find_one(
-        {"department": department_name},
-        {"_id": 0, "sub_departments": 1}
-    )
+async def get_department_structure(department_name: str, request: Request):
+    doc = department_cache.get(("structure", department_name))
+    if doc is MISSING:
+        doc = await department_collection.find_one(
+            {"department": department_name},
+            {"_id": 0, "sub_departments": 1}
+        )
 
-    if not doc:
-        raise HTTPException(404, "Department not found")
+        if not doc:
+            raise HTTPException(404, "Department not found")
+
+        department_cache.set(("structure", department_name), doc)
 
-    return doc
+    return etag_response(request, doc)
@@ -1,49 +1,110 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query, Request
 from bson import ObjectId
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, Optional
 
 from api.core.database import doctor_collection
-from api.utils.helpers import doctor_helper
+from api.models.doctor import Doctor, DOCTOR_FIELD_PRESETS
+from api.services.doctor_index import doctor_index
+from api.utils.helpers import doctor_helper, build_projection
+from api.utils.responses import etag_response, ndjson_response
+from api.utils.writes import insert_and_return, update_and_return
 
 router = APIRouter(prefix="/doctors", tags=["Doctors"])
 
+DEFAULT_PAGE_SIZE = 50
+
+
+def doctor_projection(fields: Optional[str]):
+    try:
+        return build_projection(fields, Doctor, DOCTOR_FIELD_PRESETS)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
 @router.post("")
-def create_doctor(payload: Dict[str, Any] = Body(...)):
-    result = doctor_collection.insert_one(payload)
-    doc = doctor_collection.find_one({"_id": result.inserted_id})
+async def create_doctor(payload: Dict[str, Any] = Body(...)):
+    payload["updated_at"] = datetime.utcnow()
+    doc = await insert_and_return(doctor_collection, payload)
+    doctor_index.put(doc)
     return doctor_helper(doc)
 
 @router.get("")
-def get_doctors():
-    return [doctor_helper(d) for d in doctor_collection.find()]
+async def get_doctors(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    projection = doctor_projection(fields)
+
+    query = {}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(400, "Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+
+    # stream ตรงจาก cursor (limit/cursor ยังใช้ได้ แต่ไม่มี next_cursor)
+    if format == "ndjson":
+        docs = doctor_collection.find(query, projection).sort("_id", 1)
+        return ndjson_response(docs.limit(limit) if limit else docs)
+
+    # ไม่ส่ง limit/cursor มา → คืน list ทั้งหมดแบบเดิม
+    if limit is None and cursor is None:
+        return etag_response(request, [
+            doctor_helper(d) async for d in doctor_collection.find({}, projection)
+        ])
+
+    # keyset pagination บน _id: หน้าถัดไปเริ่มหลัง _id ตัวสุดท้ายของหน้าก่อน
+    limit = limit or DEFAULT_PAGE_SIZE
+
+    docs = await doctor_collection.find(query, projection).sort("_id", 1).limit(limit + 1).to_list()
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    page = {
+        "items": [doctor_helper(d) for d in docs],
+        "next_cursor": str(docs[-1]["_id"]) if has_more else None
+    }
+    if include_total:
+        page["total"] = await doctor_collection.estimated_document_count()
+    return etag_response(request, page)
 
 @router.get("/{doctor_id}")
-def get_doctor(doctor_id: str):
-    doc = doctor_collection.find_one({"_id": ObjectId(doctor_id)})
+async def get_doctor(doctor_id: str, request: Request, fields: Optional[str] = None):
+    doc = await doctor_collection.find_one(
+        {"_id": ObjectId(doctor_id)},
+        doctor_projection(fields)
+    )
     if not doc:
         raise HTTPException(404, "Doctor not found")
-    return doctor_helper(doc)
+    return etag_response(request, doctor_helper(doc))
 
 @router.put("/{doctor_id}")
-def update_doctor(doctor_id: str, payload: Dict[str, Any]):
+async def update_doctor(doctor_id: str, payload: Dict[str, Any]):
     payload.pop("_id", None)
     payload.pop("id", None)
+    payload["updated_at"] = datetime.utcnow()
 
-    result = doctor_collection.update_one(
+    doc = await update_and_return(
+        doctor_collection,
         {"_id": ObjectId(doctor_id)},
         {"$set": payload}
     )
 
-    if result.matched_count == 0:
+    if not doc:
         raise HTTPException(404, "Doctor not found")
 
-    return doctor_helper(
-        doctor_collection.find_one({"_id": ObjectId(doctor_id)})
-    )
+    doctor_index.put(doc)
+    return doctor_helper(doc)
 
 @router.delete("/{doctor_id}")
-def delete_doctor(doctor_id: str):
-    result = doctor_collection.delete_one({"_id": ObjectId(doctor_id)})
+async def delete_doctor(doctor_id: str):
+    result = await doctor_collection.delete_one({"_id": ObjectId(doctor_id)})
+    doctor_index.remove(doctor_id)
     if result.deleted_count == 0:
         raise HTTPException(404, "Doctor not found")
     return {"message": "Doctor deleted successfully"}
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
 from bson import ObjectId
 from datetime import datetime
-
-from api.core.database import leave_collection, doctor_collection, session_collection, shift_collection
-from api.models.leave import LeaveRequest
-from api.services.line_service import send_line_message
+from pymongo import ReturnDocument
+
+from api.core.database import leave_collection, run_in_transaction
+from api.models.leave import LeaveRequest, BulkLeaveDecision
+from api.services.outbox import enqueue_multicast, enqueue_doctor_multicast, dispatch_outbox
+from api.services.doctor_index import doctor_index
+from api.services.replacements import claim_replacement, claim_failure, materialize_replacement_shifts, remove_replacement_shifts
+from api.services.roster import refresh_roster_for_leave, refresh_roster_for_leaves
+from api.services.session_store import session_store
+from api.utils.helpers import LEAVE_NATIVE_DATES_HIDDEN, to_bson_date
+from api.utils.responses import ndjson_response
+from api.utils.writes import update_many_by_ids, update_and_return
 
 router = APIRouter(prefix="/leaves", tags=["Leaves"])
 
@@ -18,55 +26,65 @@ def serialize(doc):
 # CREATE LEAVE
 # ===============================
 @router.post("/")
-def create_leave(data: LeaveRequest):
+async def create_leave(data: LeaveRequest, background_tasks: BackgroundTasks):
     doc = data.dict()
+    doc["start_on"] = to_bson_date(doc["start_date"])
+    doc["end_on"] = to_bson_date(doc["end_date"])
     doc["start_date"] = str(doc["start_date"])
     doc["end_date"] = str(doc["end_date"])
     doc["created_at"] = datetime.utcnow()
     doc["status"] = "waiting_replacement"
+    doc["_id"] = ObjectId()
+    leave_id = str(doc["_id"])
 
-    result = leave_collection.insert_one(doc)
-    leave_id = str(result.inserted_id)
-
-    # ✅ ส่ง LINE หาแพทย์ตัวแทน
-    for r in doc["replacement_doctors"]:
-        doctor = doctor_collection.find_one(
-            {"_id": ObjectId(r["doctor_id"])}
-        )
-
-        if not doctor or not doctor.get("line_id"):
-            continue
+    # ✅ หาแพทย์ตัวแทนจาก identity index (ตัวที่ไม่อยู่ใน index ถามรวมใน query เดียว)
+    replacements = await doctor_index.get_many(
+        r["doctor_id"] for r in doc["replacement_doctors"]
+    )
 
-        # 1️⃣ ส่ง LINE
-        send_line_message(
-            doctor["line_id"],
-            f"""
+    # context ของแต่ละคนมี doctor_id ไว้ให้ webhook claim ได้ใน round-trip เดียว
+    contexts = {
+        d.line_id: {
+            "leave_id": leave_id,
+            "doctor_id": d.id,
+            "doctor_name": d.thai_fullname
+        }
+        for d in replacements.values()
+        if d.line_id
+    }
+    line_ids = list(contexts)
+
+    # ใบลา + outbox + session เขียนใน transaction เดียว
+    # ล้มกลางทาง = ไม่มีอะไรถูกเขียน (ไม่มีใบลาที่ค้างโดยไม่มีใครได้รับคำเชิญ)
+    async def write(session):
+        await leave_collection.insert_one(doc, session=session)
+
+        if line_ids:
+            # 1️⃣ ส่ง LINE: ข้อความเหมือนกันทุกคน → multicast ผ่าน outbox
+            await enqueue_multicast(
+                line_ids,
+                f"""
     มีคำขอเวรแทน
 
     วันที่: {doc['start_date']}
     แพทย์: {doc['thai_full_name']}
 
     พิมพ์ OK เพื่อรับเวร
-    """
-        )
+    """,
+                session=session
+            )
 
-        # 2️⃣ อัพเดทสถานะเป็นรอการตอบรับ
-        session_collection.update_one(
-            {"user_id": doctor["line_id"]},
-            {
-                "$set": {
-                    "state": "waiting_accept_leave",
-                    "context": {
-                        "leave_id": leave_id
-                    },
-                    "updated_at": datetime.utcnow()
-                }
-            },
-            upsert=True
-        )
+            # 2️⃣ อัพเดทสถานะเป็นรอการตอบรับ (ทุกคนใน bulk_write เดียว)
+            await session_store.transition_many(contexts, "waiting_accept_leave", session=session)
+
+    await run_in_transaction(write)
 
+    if line_ids:
+        background_tasks.add_task(dispatch_outbox)
 
     doc["_id"] = leave_id
+    for field in LEAVE_NATIVE_DATES_HIDDEN:
+        doc.pop(field)
     return doc
 
 
@@ -74,9 +92,12 @@ def create_leave(data: LeaveRequest):
 # GET ALL
 # ===============================
 @router.get("/")
-def get_leaves():
+async def get_leaves(format: str = Query("json", pattern="^(json|ndjson)$")):
+    if format == "ndjson":
+        return ndjson_response(leave_collection.find({}, LEAVE_NATIVE_DATES_HIDDEN).sort("created_at", -1))
+
     leaves = []
-    for doc in leave_collection.find().sort("created_at", -1):
+    async for doc in leave_collection.find({}, LEAVE_NATIVE_DATES_HIDDEN).sort("created_at", -1):
         leaves.append(serialize(doc))
     return leaves
 
@@ -85,9 +106,9 @@ def get_leaves():
 # GET BY DOCTOR
 # ===============================
 @router.get("/doctor/{doctor_id}")
-def get_by_doctor(doctor_id: str):
+async def get_by_doctor(doctor_id: str):
     leaves = []
-    for doc in leave_collection.find({"doctor_id": doctor_id}):
+    async for doc in leave_collection.find({"doctor_id": doctor_id}, LEAVE_NATIVE_DATES_HIDDEN):
         leaves.append(serialize(doc))
     return leaves
 
@@ -96,11 +117,33 @@ def get_by_doctor(doctor_id: str):
 # UPDATE
 # ===============================
 @router.put("/{leave_id}")
-def update_leave(leave_id: str, data: LeaveRequest):
-    leave_collection.update_one(
+async def update_leave(leave_id: str, data: LeaveRequest):
+    fields = data.dict(exclude_unset=True)
+    for key, native in (("start_date", "start_on"), ("end_date", "end_on")):
+        if key in fields:
+            fields[native] = to_bson_date(fields[key])
+            fields[key] = str(fields[key])
+
+    before = await leave_collection.find_one_and_update(
         {"_id": ObjectId(leave_id)},
-        {"$set": data.dict(exclude_unset=True)}
+        {"$set": fields},
+        return_document=ReturnDocument.BEFORE
     )
+
+    if not before:
+        return {"message": "updated"}
+
+    after = {**before, **fields}
+
+    # shift แทนถูกเขียนตามช่วงวัน / เวรเดิม → ลบแล้วเขียนใหม่ตามใบลาที่แก้แล้ว
+    if before.get("shifts_materialized"):
+        await remove_replacement_shifts([before["_id"]])
+        doctor_id = (after.get("accepted_by") or {}).get("doctor_id")
+        if doctor_id and after.get("status") != "rejected":
+            await materialize_replacement_shifts(after, doctor_id)
+
+    # ช่วงวันเดิมกับช่วงใหม่อาจไม่ตรงกัน → refresh roster ทั้งสองช่วง
+    await refresh_roster_for_leaves([before, after])
     return {"message": "updated"}
 
 
@@ -108,8 +151,11 @@ def update_leave(leave_id: str, data: LeaveRequest):
 # DELETE
 # ===============================
 @router.delete("/{leave_id}")
-def delete_leave(leave_id: str):
-    leave_collection.delete_one({"_id": ObjectId(leave_id)})
+async def delete_leave(leave_id: str):
+    leave = await leave_collection.find_one_and_delete({"_id": ObjectId(leave_id)})
+    if leave:
+        await remove_replacement_shifts([leave["_id"]])
+        await refresh_roster_for_leave(leave)
     return {"message": "deleted"}
 
 
@@ -117,8 +163,9 @@ def delete_leave(leave_id: str):
 # APPROVE
 # ===============================
 @router.post("/{leave_id}/approve")
-def approve_leave(leave_id: str, approver_name: str):
-    leave_collection.update_one(
+async def approve_leave(leave_id: str, approver_name: str):
+    leave = await update_and_return(
+        leave_collection,
         {"_id": ObjectId(leave_id)},
         {
             "$set": {
@@ -128,6 +175,9 @@ def approve_leave(leave_id: str, approver_name: str):
             }
         }
     )
+
+    # ใบลาที่ matched อยู่จะหลุดจากตาราง (ตารางแตกเฉพาะ status matched) → roster ต้องตาม
+    await refresh_roster_for_leave(leave)
     return {"message": "approved"}
 
 
@@ -135,8 +185,9 @@ def approve_leave(leave_id: str, approver_name: str):
 # REJECT
 # ===============================
 @router.post("/{leave_id}/reject")
-def reject_leave(leave_id: str, approver_name: str):
-    leave_collection.update_one(
+async def reject_leave(leave_id: str, approver_name: str):
+    leave = await update_and_return(
+        leave_collection,
         {"_id": ObjectId(leave_id)},
         {
             "$set": {
@@ -146,8 +197,64 @@ def reject_leave(leave_id: str, approver_name: str):
             }
         }
     )
+
+    # ใบลาไม่อนุมัติ → shift แทนที่เขียนไว้ต้องหายจากตารางด้วย
+    if leave:
+        await remove_replacement_shifts([leave["_id"]])
+        await refresh_roster_for_leave(leave)
     return {"message": "rejected"}
 
+
+# ===============================
+# BULK APPROVE / REJECT
+# ===============================
+LEAVE_DECISION_MESSAGES = {
+    "approved": "✅ คำขอลาของคุณได้รับการอนุมัติแล้ว",
+    "rejected": "❌ คำขอลาของคุณไม่ได้รับการอนุมัติ"
+}
+
+
+async def _decide_leaves(payload: BulkLeaveDecision, status: str, background_tasks: BackgroundTasks):
+    summary, docs = await update_many_by_ids(
+        leave_collection,
+        payload.ids,
+        {
+            "$set": {
+                "status": status,
+                "approved_by": payload.approver_name,
+                "approved_at": datetime.utcnow()
+            }
+        },
+        {"doctor_id": 1, "ipus": 1, "department": 1, "start_date": 1, "end_date": 1},
+        unless={"status": status}
+    )
+
+    if status == "rejected":
+        await remove_replacement_shifts(d["_id"] for d in docs)
+
+    # ใบลาที่ matched อยู่แล้วจะหลุดจากตาราง (ตารางแตกเฉพาะ status matched)
+    # refresh ครั้งเดียวต่อ ipus + department ไม่ใช่ทีละใบ
+    await refresh_roster_for_leaves(docs)
+
+    if docs:
+        await enqueue_doctor_multicast(
+            [d["doctor_id"] for d in docs if d.get("doctor_id")],
+            LEAVE_DECISION_MESSAGES[status]
+        )
+        background_tasks.add_task(dispatch_outbox)
+
+    return summary
+
+
+@router.post("/approve")
+async def approve_leaves(payload: BulkLeaveDecision, background_tasks: BackgroundTasks):
+    return await _decide_leaves(payload, "approved", background_tasks)
+
+
+@router.post("/reject")
+async def reject_leaves(payload: BulkLeaveDecision, background_tasks: BackgroundTasks):
+    return await _decide_leaves(payload, "rejected", background_tasks)
+
 # @router.post("/{leave_id}/confirm")
 # def confirm_replacement(leave_id: str, doctor_id: str):
 
@@ -167,34 +274,40 @@ def reject_leave(leave_id: str, approver_name: str):
 
 #     return {"message": "confirmed"}
 
+# เหตุผลที่ claim ไม่สำเร็จ (claim_failure) → detail ของ 409
+CONFIRM_CONFLICTS = {
+    "taken": "Leave already matched to another doctor",
+    "closed": "Leave is not waiting for a replacement",
+    "not_listed": "Doctor is not a replacement candidate for this leave",
+}
+
 @router.post("/{leave_id}/confirm")
-def confirm_replacement(leave_id: str, doctor_id: str):
+async def confirm_replacement(leave_id: str, doctor_id: str):
 
-    leave = leave_collection.find_one({"_id": ObjectId(leave_id)})
-    if not leave:
-        raise HTTPException(404, "Leave not found")
+    doctor = await doctor_index.get(doctor_id)
+    if not doctor:
+        raise HTTPException(404, "Doctor not found")
 
-    # อัปเดตสถานะ
-    for d in leave["replacement_doctors"]:
-        if d["doctor_id"] == doctor_id:
-            d["status"] = "accepted"
+    accepted_by = {
+        "doctor_id": doctor.id,
+        "name": doctor.thai_fullname,
+        "line_id": doctor.line_id,
+        "accepted_at": datetime.utcnow()
+    }
 
-    leave_collection.update_one(
-        {"_id": ObjectId(leave_id)},
-        {"$set": {"replacement_doctors": leave["replacement_doctors"]}}
-    )
+    # claim แบบ atomic (เงื่อนไขเดียวกับ LINE OK): ใบลาต้องยังรอผู้แทนและแพทย์คนนี้ยัง pending
+    leave = await claim_replacement(leave_id, accepted_by)
 
-    # 🔥 สร้าง shift ให้แพทย์แทน
-    shift_collection.insert_one({
-        "doctor_id": doctor_id,
-        "date": leave["start_date"],   # หรือ loop ถ้าลาหลายวัน
-        "ipus": leave["ipus"],
-        "department": leave["department"],
-        "sub_department": leave["sub_department"],
-        "shift_name": leave["shift_name"],  # ต้องส่งมาจากตอนขอลา
-        "replacement": True,
-        "status": "approved",
-        "created_at": datetime.utcnow()
-    })
+    if not leave:
+        reason = await claim_failure(leave_id, doctor.id)
+        if reason == "not_found":
+            raise HTTPException(404, "Leave not found")
+        if reason != "mine":
+            raise HTTPException(409, CONFIRM_CONFLICTS[reason])
+        # กดยืนยันซ้ำโดยแพทย์ที่ได้ไปแล้ว → materialize ซ้ำได้ (idempotent) ไม่แตะ accepted_by เดิม
+        leave = await leave_collection.find_one({"_id": ObjectId(leave_id)})
+
+    # 🔥 สร้าง shift ให้แพทย์แทน ครบทุกวันลา (insert_many ครั้งเดียว, กดยืนยันซ้ำได้)
+    await materialize_replacement_shifts(leave, doctor.id)
 
     return {"message": "confirmed"}
@@ -1,52 +1,55 @@
-from fastapi import APIRouter, Request
-from datetime import datetime
-from bson import ObjectId
+from fastapi import APIRouter, BackgroundTasks, Request
+from datetime import datetime, timedelta
 
-from api.core.database import doctor_collection, session_collection, leave_collection
+from api.core.config import LINE_REPLY_TOKEN_TTL
 from api.models.line import SendLineRequest
-from api.services.line_service import send_line_message
+from api.services.event_queue import KeyedSerialQueue, wait_all
+from api.services.line_dedup import claim_event
+from api.services.doctor_index import doctor_index
+from api.services.session_store import session_store
+from api.services.outbox import enqueue_push, enqueue_reply, dispatch_outbox
+from api.services.replacements import claim_replacement, claim_failure, materialize_replacement_shifts
 
 router = APIRouter()
 
+line_events = KeyedSerialQueue()
+
+# เหตุผลที่ claim ไม่สำเร็จ (claim_failure) → ข้อความตอบกลับ
+CLAIM_FAILURE_REPLIES = {
+    "not_found": "ไม่พบรายการ",
+    "mine": "คุณรับเวรนี้ไปแล้ว",
+    "taken": "มีคนรับเวรไปแล้ว",
+    "closed": "รายการนี้ปิดแล้ว",
+    "not_listed": "คุณไม่ได้อยู่ในรายชื่อแพทย์แทน",
+}
+
 # -------------------------
 # Session helper
 # -------------------------
-def get_session(user_id):
-    session = session_collection.find_one({"user_id": user_id})
-
-    if not session:
-        session = {
-            "user_id": user_id,
-            "state": "idle",
-            "updated_at": datetime.utcnow()
-        }
-        session_collection.insert_one(session)
-
-    return session
-
-def update_state(user_id, state, context=None):
-    session_collection.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "state": state,
-                "context": context or {},
-                "updated_at": datetime.utcnow()
-            }
-        },
-        upsert=True
-    )
-
-def get_thai_fullname(doctor: dict) -> str:
-    return f"{doctor.get('thai_first_name', '')} {doctor.get('thai_last_name', '')}".strip()
+async def get_session(user_id):
+    return await session_store.load(user_id)
+
+async def update_state(user_id, state, context=None):
+    return await session_store.transition(user_id, state, context)
+
+def reply_deadline(event) -> datetime:
+    """เวลาที่ replyToken ของ event ยังใช้ได้ (นับจาก timestamp ของ event)"""
+    if not event.get("replyToken"):
+        return datetime.utcnow()
+
+    timestamp = event.get("timestamp")
+    sent_at = datetime.utcfromtimestamp(timestamp / 1000) if timestamp else datetime.utcnow()
+    return sent_at + timedelta(seconds=LINE_REPLY_TOKEN_TTL)
 
 @router.post("/send-line")
-def send_line_api(data: SendLineRequest):
-    result = send_line_message(data.to, data.message)
+async def send_line_api(data: SendLineRequest, background_tasks: BackgroundTasks):
+    outbox_id = await enqueue_push(data.to, data.message)
+    background_tasks.add_task(dispatch_outbox)
 
+    # ผลการส่งจริงดูได้ที่ GET /outbox/{outbox_id}
     return {
-        "status": "sent",
-        "line_response": result
+        "status": "queued",
+        "outbox_id": outbox_id
     }
 
 # -------------------------
@@ -58,166 +61,168 @@ def send_line_api(data: SendLineRequest):
 #     return {"status": "ok"}
 
 
-@router.post("/webhook/line")
-async def webhook(request: Request):
-    body = await request.json()
+async def _handle_event(event, replies: list):
+    user_id = event["source"].get("userId")
+    msg = event.get("message", {}).get("text", "").strip()
+
+    if not user_id or not msg:
+        return
+
+    session = await get_session(user_id)
+    state = session["state"]
+
+    # -------------------------
+    # STATE: idle → รับรหัสแพทย์
+    # -------------------------
+    if state == "idle":
+        doctor = await doctor_index.by_code(msg)
+
+        if not doctor:
+            replies.append("❌ ไม่พบรหัสแพทย์")
+            return
+
+        await update_state(user_id, "confirm", {
+            "doctor_id": doctor.id
+        })
+
+        doctor_name = doctor.thai_fullname
+
+        replies.append(f"ยืนยัน {doctor_name}\nพิมพ์ 1=ยืนยัน 2=ยกเลิก")
+
+    # -------------------------
+    # STATE: confirm
+    # -------------------------
+    # elif state == "confirm":
+    #     if msg == "1":
+    #         leave_id = session["context"].get("leave_id")
+
+    #         accepted_by = {
+    #             "doctor_id": str(doctor["_id"]),
+    #             "name": f"{doctor.get('thai_first_name', '')} {doctor.get('thai_last_name', '')}".strip(),
+    #             "line_id": user_id,
+    #             "accepted_at": datetime.utcnow()
+    #         }
+
+    #         result = leave_collection.update_one(
+    #             {
+    #                 "_id": ObjectId(leave_id),
+    #                 "replacement_doctors": {
+    #                     "$elemMatch": {
+    #                         "doctor_id": str(doctor["_id"]),
+    #                         "status": "pending"
+    #                     }
+    #                 }
+    #             },
+    #             {
+    #                 "$set": {
+    #                     "replacement_doctors.$.status": "matched",
+    #                     "accepted_by": accepted_by,
+    #                     "status": "matched"
+    #                 }
+    #             }
+    #         )
+
+    #         if result.matched_count == 0:
+    #             send_line_message(user_id, "❌ มีผู้อื่นรับเวรนี้ไปแล้ว")
+    #             update_state(user_id, "idle")
+    #             return {"status": "no-match"}
+
+    #         update_state(user_id, "idle")
+    #         send_line_message(user_id, "✅ รับเวรแทนเรียบร้อยแล้ว")
+
+    #     elif msg == "2":
+    #         update_state(user_id, "idle")
+    #         send_line_message(user_id, "ยกเลิกแล้ว")
+
+   # -------------------------
+    # STATE: waiting_accept_leave
+    # -------------------------
+    elif state == "waiting_accept_leave":
+
+        if msg.lower() != "ok":
+            replies.append("พิมพ์ OK เพื่อยืนยันรับเวร")
+            return
+
+        context = session["context"]
+        leave_id = context["leave_id"]
+        doctor_id = context.get("doctor_id")
+        doctor_name = context.get("doctor_name")
+
+        # session ที่สร้างก่อนเก็บ doctor_id ไว้ใน context → หาแพทย์จาก LINE
+        if not doctor_id:
+            doctor = await doctor_index.by_line_id(user_id)
 
-    for event in body.get("events", []):
-        user_id = event["source"].get("userId")
-        msg = event.get("message", {}).get("text", "").strip()
+            if not doctor:
+                replies.append("กรุณาลงทะเบียน LINE ก่อน")
+                await update_state(user_id, "idle")
+                return
+
+            doctor_id = doctor.id
+            doctor_name = doctor.thai_fullname
+
+        accepted_by = {
+            "doctor_id": doctor_id,
+            "name": doctor_name,
+            "line_id": user_id,
+            "accepted_at": datetime.utcnow()
+        }
 
-        if not user_id or not msg:
-            continue
+        # claim แบบ atomic (เงื่อนไขเดียวกับ POST /leaves/{id}/confirm)
+        # หลายคนตอบ OK พร้อมกัน จะมีแค่คนเดียวที่ได้ leave กลับมา
+        leave = await claim_replacement(leave_id, accepted_by)
 
-        session = get_session(user_id)
-        state = session["state"]
+        if not leave:
+            replies.append(CLAIM_FAILURE_REPLIES[await claim_failure(leave_id, doctor_id)])
+            await update_state(user_id, "idle")
+            return
 
-        # -------------------------
-        # STATE: idle → รับรหัสแพทย์
-        # -------------------------
-        if state == "idle":
-            doctor = doctor_collection.find_one(
-                {"care_provider_code": msg}
-            )
+        # เขียน shift แทนครบทุกวันลาทันทีที่ match
+        await materialize_replacement_shifts(leave, doctor_id)
 
-            if not doctor:
-                send_line_message(user_id, "❌ ไม่พบรหัสแพทย์")
-                continue
-
-            update_state(user_id, "confirm", {
-                "doctor_id": str(doctor["_id"])
-            })
-
-            doctor_name = f"{doctor.get('thai_first_name', '')} {doctor.get('thai_last_name', '')}".strip()
-
-            send_line_message(
-                user_id,
-                f"ยืนยัน {doctor_name}\nพิมพ์ 1=ยืนยัน 2=ยกเลิก"
-            )
-
-        # -------------------------
-        # STATE: confirm
-        # -------------------------
-        # elif state == "confirm":
-        #     if msg == "1":
-        #         leave_id = session["context"].get("leave_id")
-
-        #         accepted_by = {
-        #             "doctor_id": str(doctor["_id"]),
-        #             "name": f"{doctor.get('thai_first_name', '')} {doctor.get('thai_last_name', '')}".strip(),
-        #             "line_id": user_id,
-        #             "accepted_at": datetime.utcnow()
-        #         }
-
-        #         result = leave_collection.update_one(
-        #             {
-        #                 "_id": ObjectId(leave_id),
-        #                 "replacement_doctors": {
-        #                     "$elemMatch": {
-        #                         "doctor_id": str(doctor["_id"]),
-        #                         "status": "pending"
-        #                     }
-        #                 }
-        #             },
-        #             {
-        #                 "$set": {
-        #                     "replacement_doctors.$.status": "matched",
-        #                     "accepted_by": accepted_by,
-        #                     "status": "matched"
-        #                 }
-        #             }
-        #         )
-
-        #         if result.matched_count == 0:
-        #             send_line_message(user_id, "❌ มีผู้อื่นรับเวรนี้ไปแล้ว")
-        #             update_state(user_id, "idle")
-        #             return {"status": "no-match"}
-
-        #         update_state(user_id, "idle")
-        #         send_line_message(user_id, "✅ รับเวรแทนเรียบร้อยแล้ว")
-
-        #     elif msg == "2":
-        #         update_state(user_id, "idle")
-        #         send_line_message(user_id, "ยกเลิกแล้ว")
-
-       # -------------------------
-        # STATE: waiting_accept_leave
-        # -------------------------
-        elif state == "waiting_accept_leave":
-
-            if msg.lower() != "ok":
-                send_line_message(user_id, "พิมพ์ OK เพื่อยืนยันรับเวร")
-                continue
-
-            leave_id = session["context"]["leave_id"]
-
-            leave = leave_collection.find_one({
-                "_id": ObjectId(leave_id)
-            })
-
-            if not leave:
-                send_line_message(user_id, "ไม่พบรายการ")
-                update_state(user_id, "idle")
-                continue
-
-            doctor = doctor_collection.find_one({
-                "line_id": user_id
-            })
+        replies.append("✅ รับเวรสำเร็จ")
 
-            if not doctor:
-                send_line_message(user_id, "กรุณาลงทะเบียน LINE ก่อน")
-                update_state(user_id, "idle")
-                continue
-
-            # เช็คว่ามีคนรับแล้วหรือยัง
-            already = any(
-                d["status"] == "matched"
-                for d in leave["replacement_doctors"]
-            )
-
-            if already:
-                send_line_message(user_id, "มีคนรับเวรไปแล้ว")
-                update_state(user_id, "idle")
-                continue
-
-            doctor_name = get_thai_fullname(doctor)
-
-            accepted_by = {
-                "doctor_id": str(doctor["_id"]),
-                "name": doctor_name,
-                "line_id": user_id,
-                "accepted_at": datetime.utcnow()
-            }
-
-            result = leave_collection.update_one(
-                {
-                    "_id": ObjectId(leave_id),
-                    "replacement_doctors": {
-                        "$elemMatch": {
-                            "doctor_id": str(doctor["_id"]),
-                            "status": "pending"
-                        }
-                    }
-                },
-                {
-                    "$set": {
-                        "replacement_doctors.$.status": "matched",
-                        "accepted_by": accepted_by,
-                        "status": "matched"
-                    }
-                }
-            )
-
-            if result.modified_count == 0:
-                send_line_message(user_id, "คุณไม่ได้อยู่ในรายชื่อแพทย์แทน")
-                update_state(user_id, "idle")
-                continue
-
-            send_line_message(user_id, "✅ รับเวรสำเร็จ")
-
-            update_state(user_id, "idle")
-            continue
+        await update_state(user_id, "idle")
+
+
+async def handle_event(event):
+    # LINE ส่ง event ซ้ำได้ (isRedelivery) → ทิ้งก่อนแตะ session / LINE
+    if not await claim_event(event):
+        return
+
+    # ข้อความตอบกลับของ event นี้ถูกรวมแล้วส่งด้วย reply API ครั้งเดียว
+    replies = []
+    await _handle_event(event, replies)
+
+    if replies:
+        await enqueue_reply(
+            event["source"]["userId"],
+            event.get("replyToken"),
+            reply_deadline(event),
+            *replies
+        )
+
+
+async def process_events(tasks):
+    await wait_all(tasks)
+    await dispatch_outbox()
+
+
+@router.post("/webhook/line")
+async def webhook(request: Request, background_tasks: BackgroundTasks):
+    body = await request.json()
 
+    # ตอบ 200 ให้ LINE ทันที แล้วค่อยประมวลผล event เบื้องหลัง
+    # event ของ user เดียวกันรันตามลำดับ ต่าง user รันพร้อมกัน
+    tasks = [
+        line_events.submit(event["source"]["userId"], handle_event, event)
+        for event in body.get("events", [])
+        if event.get("source", {}).get("userId")
+    ]
+
+    # background task หลังส่ง response: รอ event ของ request นี้ให้เสร็จแล้วส่ง outbox
+    # (กันไม่ให้ serverless ถูก freeze ก่อนงานเสร็จ)
+    if tasks:
+        background_tasks.add_task(process_events, tasks)
 
     return {"status": "ok"}
 
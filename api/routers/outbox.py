@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException
+from bson import ObjectId
+
+from api.services.outbox import dispatch_outbox, get_outbox_entry
+
+router = APIRouter(prefix="/outbox", tags=["Outbox"])
+
+
+# เรียกจาก cron (เช่น Vercel Cron) เพื่อส่งรายการค้าง / retry
+@router.post("/dispatch")
+async def dispatch():
+    return await dispatch_outbox()
+
+
+@router.get("/{outbox_id}")
+async def get_outbox_status(outbox_id: str):
+    if not ObjectId.is_valid(outbox_id):
+        raise HTTPException(404, "Outbox entry not found")
+
+    doc = await get_outbox_entry(outbox_id)
+    if not doc:
+        raise HTTPException(404, "Outbox entry not found")
+
+    doc["_id"] = str(doc["_id"])
+    return doc
@@ -1,32 +1,136 @@
-from fastapi import APIRouter, HTTPException
+import json
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
 from bson import ObjectId
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 
+from api.core.config import SHIFT_BULK_CHUNK_SIZE, SHIFT_TABLE_ENGINE
 from api.core.database import shift_collection, leave_collection, doctor_collection
 from api.models import leave
-from api.models.shift import ShiftRequest
+from api.models.shift import ShiftRequest, BulkStatusUpdate
+from api.services.outbox import enqueue_doctor_multicast, dispatch_outbox
+from api.services.roster import table_queries, build_shift_table, read_roster, refresh_roster_for_shifts
+from api.utils.helpers import SHIFT_NATIVE_DATES_HIDDEN, dual_date_query, to_bson_date
+from api.utils.responses import ndjson_response
+from api.utils.writes import update_many_by_ids, update_and_return
 
 router = APIRouter(prefix="/shift-requests", tags=["Shifts"])
 
+SHIFT_STATUS_MESSAGES = {
+    "approved": "✅ คำขอเวรของคุณได้รับการอนุมัติแล้ว",
+    "rejected": "❌ คำขอเวรของคุณไม่ได้รับการอนุมัติ"
+}
+
+
+def _date_on(value: str):
+    try:
+        return to_bson_date(value)
+    except ValueError:
+        raise HTTPException(400, "date must be YYYY-MM-DD")
+
+
 @router.post("")
-def create_shift_request(payload: ShiftRequest):
+async def create_shift_request(payload: ShiftRequest):
     doc = payload.dict()
     doc["status"] = "pending"
     doc["requested_at"] = datetime.utcnow()
-    shift_collection.insert_one(doc)
+    doc["date_on"] = _date_on(doc["date"])
+    await shift_collection.insert_one(doc)
+    await refresh_roster_for_shifts([doc])
     return {"message": "Shift request submitted"}
 
+@router.post("/bulk")
+async def create_shift_requests_bulk(request: Request):
+    """
+    ส่งคำขอเวรทีละหลายรายการ: body เป็น JSON array หรือ NDJSON (Content-Type: application/x-ndjson)
+    ตรวจทุกรายการก่อน แล้ว insert_many แบบ unordered ทีละ chunk; คืนผลรายตัวตาม index
+    """
+    raw = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            items = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+        else:
+            items = json.loads(raw)
+    except ValueError:
+        raise HTTPException(400, "Body must be a JSON array or NDJSON")
+
+    if not isinstance(items, list):
+        raise HTTPException(400, "Body must be a JSON array or NDJSON")
+
+    results = [None] * len(items)
+    now = datetime.utcnow()
+
+    # 1) validate ทุกรายการ
+    valid = []
+    for i, item in enumerate(items):
+        try:
+            doc = ShiftRequest.model_validate(item).dict()
+            doc["date_on"] = to_bson_date(doc["date"])
+        except ValidationError as e:
+            results[i] = {
+                "index": i,
+                "status": "invalid",
+                "errors": e.errors(include_url=False, include_context=False)
+            }
+            continue
+        except ValueError:
+            results[i] = {
+                "index": i,
+                "status": "invalid",
+                "errors": [{"loc": ["date"], "msg": "date must be YYYY-MM-DD"}]
+            }
+            continue
+
+        doc["status"] = "pending"
+        doc["requested_at"] = now
+        valid.append((i, doc))
+
+    # 2) insert ทีละ chunk แบบ unordered (รายการที่พังไม่หยุดตัวอื่น)
+    for start in range(0, len(valid), SHIFT_BULK_CHUNK_SIZE):
+        chunk = valid[start:start + SHIFT_BULK_CHUNK_SIZE]
+        write_errors = {}
+        try:
+            await shift_collection.insert_many([doc for _, doc in chunk], ordered=False)
+        except BulkWriteError as e:
+            write_errors = {err["index"]: err["errmsg"] for err in e.details["writeErrors"]}
+
+        for n, (i, doc) in enumerate(chunk):
+            if n in write_errors:
+                results[i] = {"index": i, "status": "failed", "error": write_errors[n]}
+            else:
+                results[i] = {"index": i, "status": "inserted", "_id": str(doc["_id"])}
+
+        await refresh_roster_for_shifts(
+            doc for n, (_, doc) in enumerate(chunk) if n not in write_errors
+        )
+
+    inserted = sum(1 for r in results if r["status"] == "inserted")
+    return {
+        "inserted": inserted,
+        "failed": len(results) - inserted,
+        "results": results
+    }
+
 @router.get("")
-def get_shift_requests(status: Optional[str] = None, date: Optional[str] = None):
+async def get_shift_requests(
+    status: Optional[str] = None,
+    date: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
     query = {}
     if status:
         query["status"] = status
     if date:
-        query["date"] = date
+        query.update(dual_date_query("date_on", {"date_on": _date_on(date)}, {"date": date}))
+
+    if format == "ndjson":
+        return ndjson_response(shift_collection.find(query, SHIFT_NATIVE_DATES_HIDDEN).sort("date", 1))
 
     results = []
-    for doc in shift_collection.find(query).sort("date", 1):
+    async for doc in shift_collection.find(query, SHIFT_NATIVE_DATES_HIDDEN).sort("date", 1):
         doc["_id"] = str(doc["_id"])
         results.append(doc)
     return results
@@ -90,81 +194,146 @@ def get_shift_requests(status: Optional[str] = None, date: Optional[str] = None)
 #     return results
 
 @router.get("/table")
-def get_shift_table(ipus: str, department: str, start: str, end: str):
-
-    query = {
-        "ipus": ipus,
-        "department": department,
-        "date": {"$gte": start, "$lte": end},
-        "status": {"$ne": "rejected"}
-    }
-
-    results = []
-
-    # ===============================
-    # 1) SHIFT ปกติ
-    # ===============================
-    for doc in shift_collection.find(query):
-        doc["_id"] = str(doc["_id"])
-        doc["shift_key"] = f'{doc["sub_department"]}|{doc["shift_name"]}'
-        results.append(doc)
-
-    # ===============================
-    # 2) SHIFT แพทย์ที่มาแทน (🔥 ตรงนี้แหละ)
-    # ===============================
-    matched_leaves = leave_collection.find({
-        "status": "matched",
-        "ipus": ipus,
-        "department": department,
-        "start_date": {"$lte": end},
-        "end_date": {"$gte": start}
-    })
-
-    for leave in matched_leaves:
-        accepted = leave.get("accepted_by")
-        if not accepted:
-            continue
-
-        doctor = doctor_collection.find_one({
-            "_id": ObjectId(accepted["doctor_id"])
-        })
-        if not doctor:
-            continue
-
-        leave_start = datetime.strptime(leave["start_date"], "%Y-%m-%d")
-        leave_end = datetime.strptime(leave["end_date"], "%Y-%m-%d")
-
-        d = leave_start
-        while d <= leave_end:
-            date_str = d.strftime("%Y-%m-%d")
-
-            replacement_shift = {
-                "_id": f"replacement-{leave['_id']}-{date_str}",
-                "doctor_id": str(doctor["_id"]),
-                "thai_first_name": doctor.get("thai_first_name"),
-                "thai_last_name": doctor.get("thai_last_name"),
-
-                "department": doctor.get("department"),
-                "sub_department": leave.get("sub_department"),
-                "shift_name": leave.get("shift_name"),
-                "shift_key": f"{leave.get('sub_department')}|{leave.get('shift_name')}",
-
-                "date": date_str,
-                "replacement": True,
-                "replacing_doctor_id": leave.get("doctor_id")
-            }
+async def get_shift_table(
+    ipus: str,
+    department: str,
+    start: str,
+    end: str,
+    engine: Optional[str] = None
+):
+    engine = engine or SHIFT_TABLE_ENGINE
+    # วันที่ผิดรูปแบบ → 400 ก่อนถึง query
+    _date_on(start)
+    _date_on(end)
+
+    if engine == "pipeline":
+        return await _shift_table_pipeline(ipus, department, start, end)
+    if engine == "python":
+        return await build_shift_table(ipus, department, start, end)
+    if engine == "roster":
+        return await read_roster(ipus, department, start, end)
+
+    raise HTTPException(400, "engine must be 'python', 'pipeline' or 'roster'")
+
+
+async def _shift_table_pipeline(ipus: str, department: str, start: str, end: str):
+    """
+    ทำทั้งตารางใน aggregation เดียวฝั่ง server:
+    shift ปกติ + $unionWith leaves ที่ matched → $lookup แพทย์ที่มาแทน → แตกเป็นรายวัน
+    (ต้องใช้ MongoDB 5.0+ สำหรับ $dateDiff / $dateAdd)
+    """
+    query, leave_query = table_queries(ipus, department, start, end)
+
+    def key_part(field):
+        return {"$ifNull": [{"$toString": field}, "None"]}
+
+    def native_or_parsed(native, text):
+        # ใบลาที่ยังไม่ migrate ไม่มี BSON date → parse string เดิม
+        return {"$ifNull": [native, {"$dateFromString": {"dateString": text, "format": "%Y-%m-%d"}}]}
+
+    pipeline = [
+        # 1) SHIFT ปกติ
+        {"$match": query},
+        {"$project": SHIFT_NATIVE_DATES_HIDDEN},
+        {"$set": {
+            "_id": {"$toString": "$_id"},
+            "shift_key": {"$concat": [key_part("$sub_department"), "|", key_part("$shift_name")]}
+        }},
+
+        # 2) SHIFT แพทย์ที่มาแทน
+        {"$unionWith": {
+            "coll": leave_collection.name,
+            "pipeline": [
+                {"$match": {**leave_query, "accepted_by": {"$ne": None}}},
+                {"$set": {
+                    "_doctor_oid": {"$convert": {
+                        "input": "$accepted_by.doctor_id",
+                        "to": "objectId",
+                        "onError": None,
+                        "onNull": None
+                    }}
+                }},
+                {"$lookup": {
+                    "from": doctor_collection.name,
+                    "localField": "_doctor_oid",
+                    "foreignField": "_id",
+                    "pipeline": [
+                        {"$project": {"thai_first_name": 1, "thai_last_name": 1, "department": 1}}
+                    ],
+                    "as": "_doctor"
+                }},
+                {"$unwind": "$_doctor"},
+                # ตัดช่วงลาให้อยู่ในช่วง start..end ที่ขอดู
+                {"$set": {
+                    "_start": {"$max": [native_or_parsed("$start_on", "$start_date"), to_bson_date(start)]},
+                    "_end": {"$min": [native_or_parsed("$end_on", "$end_date"), to_bson_date(end)]}
+                }},
+                {"$set": {
+                    "_day": {"$range": [
+                        0,
+                        {"$add": [
+                            {"$dateDiff": {"startDate": "$_start", "endDate": "$_end", "unit": "day"}},
+                            1
+                        ]}
+                    ]}
+                }},
+                {"$unwind": "$_day"},
+                {"$set": {
+                    "_date": {"$dateToString": {
+                        "date": {"$dateAdd": {"startDate": "$_start", "unit": "day", "amount": "$_day"}},
+                        "format": "%Y-%m-%d"
+                    }}
+                }},
+                {"$project": {
+                    "_id": {"$concat": ["replacement-", {"$toString": "$_id"}, "-", "$_date"]},
+                    "doctor_id": {"$toString": "$_doctor._id"},
+                    "thai_first_name": {"$ifNull": ["$_doctor.thai_first_name", None]},
+                    "thai_last_name": {"$ifNull": ["$_doctor.thai_last_name", None]},
+
+                    "department": {"$ifNull": ["$_doctor.department", None]},
+                    "sub_department": {"$ifNull": ["$sub_department", None]},
+                    "shift_name": {"$ifNull": ["$shift_name", None]},
+                    "shift_key": {"$concat": [key_part("$sub_department"), "|", key_part("$shift_name")]},
+
+                    "date": "$_date",
+                    "replacement": {"$literal": True},
+                    "replacing_doctor_id": {"$ifNull": ["$doctor_id", None]}
+                }}
+            ]
+        }}
+    ]
+
+    cursor = await shift_collection.aggregate(pipeline)
+    return await cursor.to_list()
+
+@router.patch("/status")
+async def update_shift_status_bulk(payload: BulkStatusUpdate, background_tasks: BackgroundTasks):
+    summary, docs = await update_many_by_ids(
+        shift_collection,
+        payload.ids,
+        {"$set": {"status": payload.status}},
+        {"doctor_id": 1, "ipus": 1, "department": 1, "date": 1},
+        unless={"status": payload.status}
+    )
+    await refresh_roster_for_shifts(docs)
 
-            results.append(replacement_shift)
-            d += timedelta(days=1)
+    # แจ้งผลผ่าน LINE เป็น multicast (ข้อความเดียวกันทุกคน)
+    message = SHIFT_STATUS_MESSAGES.get(payload.status)
+    if message and docs:
+        await enqueue_doctor_multicast([d["doctor_id"] for d in docs if d.get("doctor_id")], message)
+        background_tasks.add_task(dispatch_outbox)
 
-    return results
+    return summary
 
 @router.patch("/{request_id}/status")
-def update_shift_status(request_id: str, status: str):
-    result = shift_collection.update_one(
+async def update_shift_status(request_id: str, status: str):
+    doc = await update_and_return(
+        shift_collection,
         {"_id": ObjectId(request_id)},
-        {"$set": {"status": status}}
+        {"$set": {"status": status}},
+        {"ipus": 1, "department": 1, "date": 1}
     )
-    if result.matched_count == 0:
+    if not doc:
         raise HTTPException(404, "Request not found")
+    await refresh_roster_for_shifts([doc])
     return {"message": "Status updated"}
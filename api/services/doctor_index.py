@@ -0,0 +1,201 @@
+"""
+Identity index ของแพทย์ใน process
+
+map _id / care_provider_code / line_id → DoctorIdentity (เฉพาะ field ที่ใช้ระบุตัว + ชื่อ)
+- โหลดทั้งหมดครั้งแรกที่ถูกใช้ (lazy)
+- ทุก DOCTOR_INDEX_REFRESH_SECONDS ดึงเฉพาะแพทย์ที่ updated_at ใหม่กว่า watermark
+  (updated_at ล่าสุดที่อ่านจาก Mongo ลบ DOCTOR_INDEX_REFRESH_OVERLAP_SECONDS; write ของ process นี้ไม่ขยับ watermark)
+- ทุก DOCTOR_INDEX_FULL_RELOAD_SECONDS โหลดใหม่ทั้งหมด (เก็บตกการลบจาก instance อื่น)
+- write endpoint ใน routers/doctors.py อัปเดต / ลบ entry ของ process นี้ทันที
+- หาไม่เจอใน index → ถาม Mongo แล้วเก็บเข้า index
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+
+from bson import ObjectId
+
+from api.core.config import (
+    DOCTOR_INDEX_REFRESH_SECONDS,
+    DOCTOR_INDEX_FULL_RELOAD_SECONDS,
+    DOCTOR_INDEX_REFRESH_OVERLAP_SECONDS
+)
+from api.core.database import doctor_collection
+
+IDENTITY_PROJECTION = {
+    "care_provider_code": 1,
+    "line_id": 1,
+    "thai_first_name": 1,
+    "thai_last_name": 1,
+    "ipus": 1,
+    "department": 1,
+    "updated_at": 1
+}
+
+
+@dataclass(frozen=True, slots=True)
+class DoctorIdentity:
+    id: str
+    care_provider_code: Optional[str] = None
+    line_id: Optional[str] = None
+    thai_first_name: Optional[str] = None
+    thai_last_name: Optional[str] = None
+    ipus: Optional[str] = None
+    department: Optional[str] = None
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "DoctorIdentity":
+        return cls(
+            id=str(doc["_id"]),
+            care_provider_code=doc.get("care_provider_code"),
+            line_id=doc.get("line_id"),
+            thai_first_name=doc.get("thai_first_name"),
+            thai_last_name=doc.get("thai_last_name"),
+            ipus=doc.get("ipus"),
+            department=doc.get("department")
+        )
+
+    @property
+    def thai_fullname(self) -> str:
+        return f"{self.thai_first_name or ''} {self.thai_last_name or ''}".strip()
+
+
+class DoctorIdentityIndex:
+    def __init__(self, collection, refresh_seconds: float, full_reload_seconds: float, refresh_overlap_seconds: float = 0):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.refresh_overlap = timedelta(seconds=refresh_overlap_seconds)
+
+        self._by_id = {}
+        self._by_code = {}
+        self._by_line = {}
+
+        self._loaded_at = None
+        self._refreshed_at = None
+        self._watermark = None
+        self._lock = asyncio.Lock()
+
+    # -------------------------
+    # maintenance
+    # -------------------------
+    def put(self, doc: dict) -> DoctorIdentity:
+        """เพิ่ม / แทนที่ entry จาก document ของแพทย์ (ต้องมี _id)"""
+        self.remove(str(doc["_id"]))
+
+        identity = DoctorIdentity.from_doc(doc)
+        self._by_id[identity.id] = identity
+        if identity.care_provider_code:
+            self._by_code[identity.care_provider_code] = identity
+        if identity.line_id:
+            self._by_line[identity.line_id] = identity
+        return identity
+
+    def remove(self, doctor_id: str):
+        old = self._by_id.pop(doctor_id, None)
+        if old is None:
+            return
+        if self._by_code.get(old.care_provider_code) is old:
+            del self._by_code[old.care_provider_code]
+        if self._by_line.get(old.line_id) is old:
+            del self._by_line[old.line_id]
+
+    def invalidate(self):
+        """ให้การใช้งานครั้งถัดไปโหลดใหม่ทั้งหมด"""
+        self._loaded_at = None
+
+    async def _put_scanned(self, query: dict):
+        """put ทุก document ที่ query เจอ แล้วขยับ watermark จาก updated_at ของ document เหล่านั้นเท่านั้น"""
+        async for doc in self.collection.find(query, IDENTITY_PROJECTION):
+            self.put(doc)
+            updated_at = doc.get("updated_at")
+            if updated_at and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    async def _full_reload(self):
+        self._by_id, self._by_code, self._by_line = {}, {}, {}
+        self._watermark = None
+        await self._put_scanned({})
+        self._loaded_at = self._refreshed_at = time.monotonic()
+
+    async def _incremental_refresh(self):
+        # ย้อน overlap: update จาก instance อื่นที่นาฬิกาช้ากว่า / commit ทีหลังแต่ updated_at เก่ากว่า ยังถูกดึงมา
+        if self._watermark:
+            query = {"updated_at": {"$gt": self._watermark - self.refresh_overlap}}
+        else:
+            query = {"updated_at": {"$exists": True}}
+        await self._put_scanned(query)
+        self._refreshed_at = time.monotonic()
+
+    async def _ensure_fresh(self):
+        now = time.monotonic()
+        if (
+            self._loaded_at is not None
+            and now - self._loaded_at < self.full_reload_seconds
+            and now - self._refreshed_at < self.refresh_seconds
+        ):
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.full_reload_seconds:
+                await self._full_reload()
+            elif now - self._refreshed_at >= self.refresh_seconds:
+                await self._incremental_refresh()
+
+    async def _lookup(self, table: str, key, query: dict) -> Optional[DoctorIdentity]:
+        if not key:
+            return None
+
+        # อ่าน table หลัง refresh เพราะ full reload สร้าง dict ชุดใหม่
+        await self._ensure_fresh()
+        identity = getattr(self, table).get(key)
+        if identity is not None:
+            return identity
+
+        # ยังไม่อยู่ใน index (เช่นเพิ่งถูกเพิ่มจาก instance อื่น) → ถาม Mongo
+        doc = await self.collection.find_one(query, IDENTITY_PROJECTION)
+        return self.put(doc) if doc else None
+
+    # -------------------------
+    # lookups
+    # -------------------------
+    async def get(self, doctor_id: str) -> Optional[DoctorIdentity]:
+        if not ObjectId.is_valid(doctor_id):
+            return None
+        return await self._lookup("_by_id", doctor_id, {"_id": ObjectId(doctor_id)})
+
+    async def by_code(self, care_provider_code: str) -> Optional[DoctorIdentity]:
+        return await self._lookup("_by_code", care_provider_code, {"care_provider_code": care_provider_code})
+
+    async def by_line_id(self, line_id: str) -> Optional[DoctorIdentity]:
+        return await self._lookup("_by_line", line_id, {"line_id": line_id})
+
+    async def get_many(self, doctor_ids) -> dict:
+        """{doctor_id: DoctorIdentity} ของ id ที่หาเจอ; ตัวที่ไม่อยู่ใน index ถามรวมใน $in เดียว"""
+        await self._ensure_fresh()
+
+        found = {}
+        missing = []
+        for doctor_id in set(doctor_ids):
+            identity = self._by_id.get(doctor_id)
+            if identity is not None:
+                found[doctor_id] = identity
+            elif ObjectId.is_valid(doctor_id):
+                missing.append(ObjectId(doctor_id))
+
+        if missing:
+            async for doc in self.collection.find({"_id": {"$in": missing}}, IDENTITY_PROJECTION):
+                identity = self.put(doc)
+                found[identity.id] = identity
+        return found
+
+
+doctor_index = DoctorIdentityIndex(
+    doctor_collection,
+    refresh_seconds=DOCTOR_INDEX_REFRESH_SECONDS,
+    full_reload_seconds=DOCTOR_INDEX_FULL_RELOAD_SECONDS,
+    refresh_overlap_seconds=DOCTOR_INDEX_REFRESH_OVERLAP_SECONDS
+)
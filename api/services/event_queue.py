@@ -0,0 +1,39 @@
+import asyncio
+
+
+class KeyedSerialQueue:
+    """
+    คิวงาน async แยกตาม key:
+    งานที่ key เดียวกันรันตามลำดับที่ submit, งานต่าง key รันพร้อมกันได้
+    """
+
+    def __init__(self):
+        self._tails = {}
+
+    def submit(self, key, fn, *args) -> asyncio.Task:
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(previous, fn, args))
+        self._tails[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return task
+
+    def _forget(self, key, task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _run(self, previous, fn, args):
+        if previous is not None:
+            # รองานก่อนหน้าของ key เดียวกันให้จบ (ไม่สนว่าจบด้วย error หรือไม่)
+            await asyncio.wait([previous])
+        try:
+            await fn(*args)
+        except Exception as e:
+            print(f"event handler error ({fn.__name__}):", repr(e))
+
+    async def drain(self):
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+async def wait_all(tasks):
+    await asyncio.wait(tasks)
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from api.core.config import LINE_EVENT_LRU_SIZE
+from api.core.database import line_event_collection
+
+
+class LRUSet:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+
+
+_recent_events = LRUSet(LINE_EVENT_LRU_SIZE)
+
+
+async def claim_event(event) -> bool:
+    """
+    True ถ้า event นี้ยังไม่เคยถูกประมวลผล (และจองไว้แล้ว)
+    False ถ้าเป็นการส่งซ้ำ (LINE redelivery) ให้ทิ้งไปก่อนทำอะไรกับ DB / LINE
+    """
+    event_id = event.get("webhookEventId")
+    if not event_id:
+        return True
+
+    # ซ้ำใน process เดียวกัน → ไม่ต้องถาม Mongo
+    if event_id in _recent_events:
+        return False
+
+    # ซ้ำข้าม instance → unique _id ใน Mongo ตัดสิน
+    # จำใน LRU เฉพาะเมื่อ Mongo ตอบแล้ว: insert ล้มด้วยเหตุอื่น (network / failover)
+    # ต้องให้ redelivery รอบถัดไปได้ประมวลผล
+    try:
+        await line_event_collection.insert_one({
+            "_id": event_id,
+            "is_redelivery": event.get("deliveryContext", {}).get("isRedelivery", False),
+            "received_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        _recent_events.add(event_id)
+        return False
+
+    _recent_events.add(event_id)
+    return True
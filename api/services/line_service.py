@@ -1,20 +1,87 @@
 import os
-import requests
+import httpx
 
-LINE_API_URL = "https://api.line.me/v2/bot/message/push"
+from api.core.config import (
+    LINE_API_BASE_URL,
+    LINE_HTTP_TIMEOUT,
+    LINE_HTTP_CONNECT_TIMEOUT,
+    LINE_HTTP_MAX_CONNECTIONS,
+    LINE_HTTP_MAX_KEEPALIVE,
+)
+
+LINE_PUSH_PATH = "/v2/bot/message/push"
+LINE_MULTICAST_PATH = "/v2/bot/message/multicast"
+LINE_MULTICAST_LIMIT = 500
+LINE_REPLY_PATH = "/v2/bot/message/reply"
+# reply / push ส่งได้ไม่เกิน 5 ข้อความต่อ call
+LINE_MESSAGES_LIMIT = 5
 LINE_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 
-def send_line_message(to: str, message: str):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {LINE_TOKEN}"
-    }
+# client เดียวทั้ง process: connection ไป api.line.me ถูก keep-alive ไว้
+# ไม่ต้อง DNS + TCP + TLS handshake ใหม่ทุกครั้งที่ push
+_client = None
+
+
+def get_line_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=LINE_API_BASE_URL,
+            headers={"Authorization": f"Bearer {LINE_TOKEN}"},
+            timeout=httpx.Timeout(LINE_HTTP_TIMEOUT, connect=LINE_HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LINE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LINE_HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_line_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def text_messages(*texts) -> list:
+    return [{"type": "text", "text": t} for t in texts]
+
 
-    payload = {
-        "to": to,
-        "messages": [
-            {"type": "text", "text": message}
-        ]
+async def _post(path: str, payload: dict, retry_key: str = None) -> dict:
+    """ยิง LINE API แล้วคืนผลเป็น dict (ไม่ raise เพื่อไม่ให้ LINE ล่มแล้วพา request ล่มตาม)"""
+    # X-Line-Retry-Key: ส่งซ้ำด้วย key เดิม LINE จะไม่ส่งข้อความซ้ำ (ตอบ 409)
+    headers = {"X-Line-Retry-Key": retry_key} if retry_key else None
+    try:
+        response = await get_line_client().post(path, json=payload, headers=headers)
+    except httpx.HTTPError as e:
+        return {"ok": False, "status_code": None, "error": f"{type(e).__name__}: {e}"}
+
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+
+    return {
+        "ok": response.is_success,
+        "status_code": response.status_code,
+        "body": body
     }
 
-    requests.post(LINE_API_URL, headers=headers, json=payload, timeout=10)
+
+async def push_messages(to: str, messages: list, retry_key: str = None) -> dict:
+    return await _post(LINE_PUSH_PATH, {"to": to, "messages": messages}, retry_key)
+
+
+async def multicast_messages(to: list, messages: list, retry_key: str = None) -> dict:
+    """to ต้องไม่เกิน LINE_MULTICAST_LIMIT คน"""
+    return await _post(LINE_MULTICAST_PATH, {"to": to, "messages": messages}, retry_key)
+
+
+async def reply_messages(reply_token: str, messages: list) -> dict:
+    """ตอบกลับด้วย replyToken ของ event: ไม่นับโควตา push (reply ไม่รองรับ retry key)"""
+    return await _post(LINE_REPLY_PATH, {"replyToken": reply_token, "messages": messages})
+
+
+def chunked(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
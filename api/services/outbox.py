@@ -0,0 +1,213 @@
+"""
+Notification outbox
+
+handler ไม่ยิง LINE เอง แต่เขียนข้อความลง notification_outbox แล้วตอบกลับทันที
+dispatcher จะดึงไปส่งเป็น batch พร้อม retry และบันทึกผลการส่งไว้ในแต่ละรายการ
+
+dispatcher รันได้หลายแบบ:
+- BackgroundTasks หลัง response ของ handler ที่ enqueue (kick ทันที)
+- asyncio task ใน lifespan เมื่อ OUTBOX_DISPATCHER_ENABLED=true
+- worker แยก: python -m api.services.outbox
+- cron เรียก POST /outbox/dispatch
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from api.core.config import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE_SECONDS,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_POLL_INTERVAL,
+)
+from api.core.database import outbox_collection
+from api.services.doctor_index import doctor_index
+from api.services.line_service import (
+    LINE_MESSAGES_LIMIT,
+    LINE_MULTICAST_LIMIT,
+    chunked,
+    multicast_messages,
+    push_messages,
+    reply_messages,
+    text_messages,
+)
+
+
+# -------------------------
+# Enqueue
+# -------------------------
+def _outbox_doc(kind: str, to, messages: list, now: datetime) -> dict:
+    return {
+        "kind": kind,
+        "to": to,
+        "messages": messages,
+        "status": "pending",
+        "attempts": 0,
+        # ใช้เป็น X-Line-Retry-Key: ส่งซ้ำหลัง lease หลุด LINE จะไม่ส่งข้อความซ้ำ
+        "retry_key": str(uuid.uuid4()),
+        "created_at": now,
+        "next_attempt_at": now
+    }
+
+
+async def enqueue_push(to: str, *texts: str) -> str:
+    doc = _outbox_doc("push", to, text_messages(*texts), datetime.utcnow())
+    result = await outbox_collection.insert_one(doc)
+    return str(result.inserted_id)
+
+
+async def enqueue_multicast(to: list, *texts: str, session=None) -> list:
+    """ข้อความเดียวกันถึงหลายคน: 1 รายการต่อผู้รับไม่เกิน 500 คน (session = เขียนใน transaction ของผู้เรียก)"""
+    now = datetime.utcnow()
+    docs = [
+        _outbox_doc("multicast", chunk, text_messages(*texts), now)
+        for chunk in chunked(list(dict.fromkeys(to)), LINE_MULTICAST_LIMIT)
+    ]
+    if not docs:
+        return []
+
+    result = await outbox_collection.insert_many(docs, session=session)
+    return [str(i) for i in result.inserted_ids]
+
+
+async def enqueue_doctor_multicast(doctor_ids, *texts: str) -> list:
+    """multicast ถึงแพทย์ตาม doctor_id (เฉพาะคนที่ผูก LINE แล้ว)"""
+    doctors = await doctor_index.get_many(doctor_ids)
+    return await enqueue_multicast(
+        [d.line_id for d in doctors.values() if d.line_id],
+        *texts
+    )
+
+
+async def enqueue_reply(to: str, reply_token: str, expires_at: datetime, *texts: str) -> list:
+    """
+    ตอบกลับ event ด้วย reply API (หลายข้อความใน call เดียว สูงสุด 5)
+    ข้อความที่เกิน 5 จะถูก push ต่อ; ถ้า token หมดอายุก่อนส่ง dispatcher จะ push ไปที่ to แทน
+    """
+    now = datetime.utcnow()
+    chunks = chunked(list(texts), LINE_MESSAGES_LIMIT)
+    if not chunks:
+        return []
+
+    first = _outbox_doc("reply", to, text_messages(*chunks[0]), now)
+    first["reply_token"] = reply_token
+    first["reply_expires_at"] = expires_at
+
+    docs = [first] + [
+        _outbox_doc("push", to, text_messages(*chunk), now)
+        for chunk in chunks[1:]
+    ]
+    result = await outbox_collection.insert_many(docs)
+    return [str(i) for i in result.inserted_ids]
+
+
+async def get_outbox_entry(outbox_id: str):
+    return await outbox_collection.find_one({"_id": ObjectId(outbox_id)})
+
+
+# -------------------------
+# Dispatch
+# -------------------------
+def _claimable(now: datetime) -> dict:
+    return {"$or": [
+        {"status": "pending", "next_attempt_at": {"$lte": now}},
+        # worker ที่ claim ไปแล้วตายกลางทาง → ให้คนอื่นรับต่อเมื่อ lease หมด
+        {"status": "sending", "claimed_at": {"$lte": now - timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+    ]}
+
+
+async def _claim_batch(limit: int) -> list:
+    now = datetime.utcnow()
+    ids = [
+        d["_id"]
+        async for d in outbox_collection.find(_claimable(now), {"_id": 1})
+        .sort("next_attempt_at", 1)
+        .limit(limit)
+    ]
+    if not ids:
+        return []
+
+    # claim ด้วย claim_id ของรอบนี้ ถ้า dispatcher อื่นแย่ง claim ไปก่อน update_many จะไม่ match
+    claim_id = str(uuid.uuid4())
+    await outbox_collection.update_many(
+        {"_id": {"$in": ids}, **_claimable(now)},
+        {
+            "$set": {"status": "sending", "claimed_at": now, "claim_id": claim_id},
+            "$inc": {"attempts": 1}
+        }
+    )
+    return await outbox_collection.find({"claim_id": claim_id}).to_list()
+
+
+async def _deliver(doc: dict) -> dict:
+    if doc["kind"] == "multicast":
+        return await multicast_messages(doc["to"], doc["messages"], doc["retry_key"])
+
+    if doc["kind"] == "reply" and doc["reply_expires_at"] > datetime.utcnow():
+        result = await reply_messages(doc["reply_token"], doc["messages"])
+        # 400 = replyToken ใช้ไม่ได้แล้ว (หมดอายุ / ถูกใช้ไปแล้ว) → push แทน
+        if result.get("status_code") != 400:
+            return {**result, "via": "reply"}
+
+    result = await push_messages(doc["to"], doc["messages"], doc["retry_key"])
+    return {**result, "via": "push"}
+
+
+def _outcome(doc: dict, result: dict, now: datetime):
+    status_code = result.get("status_code")
+
+    # 409 = retry key นี้ถูกส่งสำเร็จไปแล้ว
+    if result["ok"] or status_code == 409:
+        return "sent", {"status": "sent", "sent_at": now}
+
+    retryable = status_code is None or status_code == 429 or status_code >= 500
+    if retryable and doc["attempts"] < OUTBOX_MAX_ATTEMPTS:
+        delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (doc["attempts"] - 1)
+        return "retry", {"status": "pending", "next_attempt_at": now + timedelta(seconds=delay)}
+
+    return "failed", {"status": "failed", "failed_at": now}
+
+
+async def dispatch_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> dict:
+    """ส่งรายการที่ถึงกำหนดจนหมด ทีละ batch; คืนจำนวน sent / retry / failed"""
+    counts = {"sent": 0, "retry": 0, "failed": 0}
+
+    while True:
+        batch = await _claim_batch(batch_size)
+        if not batch:
+            return counts
+
+        results = await asyncio.gather(*(_deliver(doc) for doc in batch))
+
+        now = datetime.utcnow()
+        updates = []
+        for doc, result in zip(batch, results):
+            outcome, fields = _outcome(doc, result, now)
+            counts[outcome] += 1
+            updates.append(UpdateOne(
+                {"_id": doc["_id"], "claim_id": doc["claim_id"]},
+                {
+                    "$set": {**fields, "last_result": result},
+                    "$unset": {"claim_id": "", "claimed_at": ""}
+                }
+            ))
+
+        await outbox_collection.bulk_write(updates, ordered=False)
+
+
+async def run_dispatcher(poll_interval: float = OUTBOX_POLL_INTERVAL):
+    while True:
+        try:
+            await dispatch_outbox()
+        except Exception as e:
+            # worker ต้องไม่ตายเพราะ Mongo/LINE สะดุดรอบเดียว
+            print("outbox dispatch error:", repr(e))
+        await asyncio.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_dispatcher())
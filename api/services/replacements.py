@@ -0,0 +1,171 @@
+"""
+Shift ของแพทย์ที่มาแทน
+
+ตอน match ใบลา (webhook OK / POST /leaves/{id}/confirm) เขียน shift จริง 1 document ต่อวันลา
+ด้วย insert_many ครั้งเดียว แล้ว mark ใบลา shifts_materialized=True
+ตาราง /shift-requests/table จะอ่าน document เหล่านี้ตรงๆ และไม่แตกใบลานั้นซ้ำอีก
+
+claim_replacement คือเงื่อนไข match เดียวที่ทั้งสองทางใช้: ใบลายังรอผู้แทน, ยังไม่มีใคร matched / accepted
+และแพทย์คนนี้ยัง pending อยู่ → ผ่านได้คนเดียวต่อใบลา
+
+_id ของแต่ละวันคำนวณจาก (leave_id, วันที่) → เรียกซ้ำ (retry / กดยืนยันซ้ำ) ไม่เกิด shift ซ้ำ
+ใบลาที่ถูกลบ / ไม่อนุมัติ / แก้ช่วงวัน ต้อง remove_replacement_shifts (แล้ว materialize ใหม่ถ้ายังมีผู้แทน)
+"""
+from datetime import datetime
+from hashlib import blake2b
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from api.core.database import shift_collection, leave_collection
+from api.services.doctor_index import doctor_index
+from api.services.roster import refresh_roster_for_leave
+from api.utils.helpers import doc_day, iter_days, to_bson_date
+
+DUPLICATE_KEY = 11000
+
+# สถานะของแพทย์ใน replacement_doctors ที่นับว่าใบลามีผู้แทนแล้ว ("accepted" = ข้อมูลจาก confirm รุ่นเก่า)
+TAKEN_STATUSES = ["matched", "accepted"]
+
+
+async def claim_replacement(leave_id, accepted_by: dict):
+    """
+    claim ใบลาให้ accepted_by["doctor_id"] แบบ atomic
+    คืนใบลาหลัง claim (status = "matched"), None = ไม่ผ่านเงื่อนไข (ดูเหตุผลด้วย claim_failure)
+    """
+    doctor_id = accepted_by["doctor_id"]
+    return await leave_collection.find_one_and_update(
+        {
+            "_id": ObjectId(leave_id),
+            "status": "waiting_replacement",
+            "replacement_doctors": {
+                "$elemMatch": {
+                    "doctor_id": doctor_id,
+                    "status": "pending"
+                }
+            },
+            "replacement_doctors.status": {"$nin": TAKEN_STATUSES}
+        },
+        {
+            "$set": {
+                "replacement_doctors.$[me].status": "matched",
+                "accepted_by": accepted_by,
+                "status": "matched"
+            }
+        },
+        array_filters=[{"me.doctor_id": doctor_id, "me.status": "pending"}],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def claim_failure(leave_id, doctor_id: str) -> str:
+    """
+    เหตุผลที่ claim_replacement ไม่ผ่าน (อ่านอีกครั้งเฉพาะทางที่ไม่สำเร็จ)
+    "not_found" | "mine" (แพทย์คนนี้ได้ไปแล้ว) | "taken" | "closed" | "not_listed"
+    """
+    current = await leave_collection.find_one(
+        {"_id": ObjectId(leave_id)},
+        {"status": 1, "accepted_by": 1, "replacement_doctors": 1}
+    )
+
+    if not current:
+        return "not_found"
+    if current.get("status") == "matched":
+        mine = (current.get("accepted_by") or {}).get("doctor_id") == doctor_id
+        return "mine" if mine else "taken"
+    if current.get("status") != "waiting_replacement":
+        return "closed"
+    if any(d.get("status") in TAKEN_STATUSES for d in current.get("replacement_doctors", [])):
+        return "taken"
+    return "not_listed"
+
+
+def replacement_shift_id(leave_id, day: str) -> ObjectId:
+    """ObjectId คงที่ของ shift แทนวัน day ของใบลา leave_id"""
+    return ObjectId(blake2b(f"{leave_id}|{day}".encode(), digest_size=12).digest())
+
+
+def replacement_shift_docs(leave: dict, doctor) -> list:
+    now = datetime.utcnow()
+    days = iter_days(
+        doc_day(leave, "start_on", "start_date"),
+        doc_day(leave, "end_on", "end_date")
+    )
+
+    return [
+        {
+            "_id": replacement_shift_id(leave["_id"], day.isoformat()),
+            "doctor_id": doctor.id,
+            "thai_first_name": doctor.thai_first_name,
+            "thai_last_name": doctor.thai_last_name,
+            "care_provider_code": doctor.care_provider_code,
+
+            "ipus": leave.get("ipus"),
+            "department": leave.get("department"),
+            "sub_department": leave.get("sub_department"),
+            "shift_name": leave.get("shift_name"),
+            "date": day.isoformat(),
+            "date_on": to_bson_date(day),
+
+            "replacement": True,
+            "replacing_doctor_id": leave.get("doctor_id"),
+            "leave_id": str(leave["_id"]),
+            "status": "approved",
+            "created_at": now
+        }
+        for day in days
+    ]
+
+
+async def materialize_replacement_shifts(leave: dict, doctor_id: str):
+    """
+    เขียน shift แทนทุกวันของใบลาให้ doctor_id; คืนจำนวน document ที่ insert ใหม่ (None = ไม่พบแพทย์)
+    วันที่มีอยู่แล้ว (duplicate _id) ถือว่าสำเร็จ
+    """
+    doctor = await doctor_index.get(doctor_id)
+    if not doctor:
+        return None
+
+    # _id ไม่รวมแพทย์ → shift ของแพทย์คนอื่นที่ค้างอยู่จะทำให้ insert ชน duplicate แล้วถูกมองว่าเขียนแล้ว
+    await shift_collection.delete_many({
+        "leave_id": str(leave["_id"]),
+        "replacement": True,
+        "doctor_id": {"$ne": doctor.id}
+    })
+
+    docs = replacement_shift_docs(leave, doctor)
+    inserted = 0
+
+    if docs:
+        try:
+            result = await shift_collection.insert_many(docs, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                raise
+            inserted = e.details["nInserted"]
+
+    await leave_collection.update_one(
+        {"_id": leave["_id"]},
+        {"$set": {"shifts_materialized": True}}
+    )
+    await refresh_roster_for_leave(leave)
+    return inserted
+
+
+async def remove_replacement_shifts(leave_ids) -> int:
+    """ลบ shift แทนที่ materialize ไว้ของใบลาเหล่านี้ (roster ให้ผู้เรียก refresh เอง); คืนจำนวนที่ลบ"""
+    leave_ids = list(leave_ids)
+    if not leave_ids:
+        return 0
+
+    result = await shift_collection.delete_many({
+        "leave_id": {"$in": [str(i) for i in leave_ids]},
+        "replacement": True
+    })
+    await leave_collection.update_many(
+        {"_id": {"$in": [ObjectId(i) for i in leave_ids]}},
+        {"$unset": {"shifts_materialized": ""}}
+    )
+    return result.deleted_count
@@ -0,0 +1,256 @@
+"""
+ตารางเวร (roster)
+
+build_shift_table ประกอบตารางจาก shift_requests + leaves ที่ matched (engine "python")
+roster_days เก็บผลนั้นไว้ล่วงหน้า 1 document ต่อ (ipus, department, date) = slot ของวันนั้น
+- write endpoint ที่กระทบตาราง (shift / leave) เรียก refresh_* ให้สร้างเฉพาะวันที่เกี่ยวข้องใหม่
+- refresh พร้อมกันหลายตัว: version ที่ขอก่อนอ่านตัดสินว่า snapshot ไหนใหม่กว่า (ตัวเก่าเขียนทับตัวใหม่ไม่ได้)
+- GET /shift-requests/table?engine=roster อ่านเป็น range query เดียวบน roster_days
+- backfill / ซ่อมทั้งหมด (เช่นหลังแก้ชื่อแพทย์):
+
+    python -m api.services.roster rebuild [ipus department]
+"""
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import date, datetime
+
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from api.core.database import shift_collection, leave_collection, roster_collection, counter_collection
+from api.services.doctor_index import doctor_index
+from api.utils.helpers import SHIFT_NATIVE_DATES_HIDDEN, clip_days, doc_day, dual_date_query, iter_days, to_bson_date
+
+
+# -------------------------
+# Build
+# -------------------------
+def table_queries(ipus: str, department: str, start: str, end: str):
+    shift_query = {
+        "ipus": ipus,
+        "department": department,
+        **dual_date_query(
+            "date_on",
+            {"date_on": {"$gte": to_bson_date(start), "$lte": to_bson_date(end)}},
+            {"date": {"$gte": start, "$lte": end}}
+        ),
+        "status": {"$ne": "rejected"}
+    }
+    # ใบลาที่เขียน shift แทนลง shift_collection แล้วจะมาทาง shift_query อยู่แล้ว
+    leave_query = {
+        "status": "matched",
+        "shifts_materialized": {"$ne": True},
+        "ipus": ipus,
+        "department": department,
+        **dual_date_query(
+            "start_on",
+            {"start_on": {"$lte": to_bson_date(end)}, "end_on": {"$gte": to_bson_date(start)}},
+            {"start_date": {"$lte": end}, "end_date": {"$gte": start}}
+        )
+    }
+    return shift_query, leave_query
+
+
+async def build_shift_table(ipus: str, department: str, start: str, end: str):
+    query, leave_query = table_queries(ipus, department, start, end)
+    window_start = date.fromisoformat(start)
+    window_end = date.fromisoformat(end)
+
+    results = []
+
+    # ===============================
+    # 1) SHIFT ปกติ
+    # ===============================
+    async for doc in shift_collection.find(query, SHIFT_NATIVE_DATES_HIDDEN):
+        doc["_id"] = str(doc["_id"])
+        doc["shift_key"] = f'{doc["sub_department"]}|{doc["shift_name"]}'
+        results.append(doc)
+
+    # ===============================
+    # 2) SHIFT แพทย์ที่มาแทน (🔥 ตรงนี้แหละ)
+    # ===============================
+    matched_leaves = leave_collection.find(leave_query)
+
+    matched_leaves = [
+        leave async for leave in matched_leaves
+        if leave.get("accepted_by")
+    ]
+
+    # แพทย์ที่มาแทนทั้งหมดจาก identity index (ไม่ต้อง find_one ทีละ leave)
+    doctors = await doctor_index.get_many(
+        leave["accepted_by"]["doctor_id"] for leave in matched_leaves
+    )
+
+    for leave in matched_leaves:
+        doctor = doctors.get(leave["accepted_by"]["doctor_id"])
+        if not doctor:
+            continue
+
+        # แตกเฉพาะวันที่อยู่ในช่วง start..end ที่ขอดู ไม่ใช่ทั้งช่วงลา
+        days = clip_days(
+            doc_day(leave, "start_on", "start_date"),
+            doc_day(leave, "end_on", "end_date"),
+            window_start,
+            window_end
+        )
+
+        for day in days:
+            date_str = day.isoformat()
+
+            replacement_shift = {
+                "_id": f"replacement-{leave['_id']}-{date_str}",
+                "doctor_id": doctor.id,
+                "thai_first_name": doctor.thai_first_name,
+                "thai_last_name": doctor.thai_last_name,
+
+                "department": doctor.department,
+                "sub_department": leave.get("sub_department"),
+                "shift_name": leave.get("shift_name"),
+                "shift_key": f"{leave.get('sub_department')}|{leave.get('shift_name')}",
+
+                "date": date_str,
+                "replacement": True,
+                "replacing_doctor_id": leave.get("doctor_id")
+            }
+
+            results.append(replacement_shift)
+
+    return results
+
+
+# -------------------------
+# Materialised roster_days
+# -------------------------
+async def read_roster(ipus: str, department: str, start: str, end: str):
+    """slot ทั้งหมดในช่วง start..end จาก roster_days (เรียงตามวัน)"""
+    cursor = roster_collection.find(
+        {"ipus": ipus, "department": department, "date": {"$gte": start, "$lte": end}},
+        {"_id": 0, "slots": 1}
+    ).sort("date", 1)
+    return [slot async for day in cursor for slot in day["slots"]]
+
+
+DUPLICATE_KEY = 11000
+
+
+async def _next_version(ipus: str, department: str) -> int:
+    counter = await counter_collection.find_one_and_update(
+        {"_id": f"roster|{ipus}|{department}"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+
+async def refresh_roster(ipus: str, department: str, start: str, end: str):
+    """
+    สร้าง roster_days ของทุกวันใน start..end ใหม่จาก build_shift_table
+    วันที่ไม่มี slot เก็บเป็น slots ว่าง (ไม่ลบ) เพื่อให้ version ของวันนั้นยังกัน snapshot เก่าได้
+    """
+    if not ipus or not department or not start or not end:
+        return
+
+    # ขอ version ก่อนอ่าน: refresh ที่ได้ version สูงกว่าอ่านหลัง write ของทุก refresh ที่ได้ version ต่ำกว่า
+    # จึงเขียนได้เฉพาะวันที่ version เดิมต่ำกว่า (หรือยังไม่มี) ตัวที่ช้ากว่าแต่ถือ snapshot เก่าจะไม่ทับ
+    version = await _next_version(ipus, department)
+
+    by_date = defaultdict(list)
+    for slot in await build_shift_table(ipus, department, start, end):
+        by_date[slot["date"]].append(slot)
+
+    now = datetime.utcnow()
+    ops = []
+    for day in iter_days(date.fromisoformat(start), date.fromisoformat(end)):
+        key = {"ipus": ipus, "department": department, "date": day.isoformat()}
+        ops.append(ReplaceOne(
+            {**key, "version": {"$not": {"$gte": version}}},
+            {**key, "slots": by_date.get(key["date"], []), "version": version, "updated_at": now},
+            upsert=True
+        ))
+
+    try:
+        await roster_collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # duplicate key = วันนั้นมี version ใหม่กว่าอยู่แล้ว (upsert ชน unique index) → ข้ามได้
+        if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+            raise
+
+
+async def _refresh_windows(docs, start_field: str, end_field: str):
+    """รวมช่วงวันของ docs เป็นช่วงเดียวต่อ ipus + department แล้ว refresh ช่วงละครั้ง"""
+    windows = {}
+    for doc in docs:
+        if not doc or not doc.get(start_field) or not doc.get(end_field):
+            continue
+        start, end = str(doc[start_field]), str(doc[end_field])
+        key = (doc.get("ipus"), doc.get("department"))
+        lo, hi = windows.get(key, (start, end))
+        windows[key] = (min(lo, start), max(hi, end))
+
+    for (ipus, department), (start, end) in windows.items():
+        await refresh_roster(ipus, department, start, end)
+
+
+async def refresh_roster_for_shifts(docs):
+    """refresh วันที่ของ shift เหล่านี้ (รวมเป็นช่วงเดียวต่อ ipus + department)"""
+    await _refresh_windows(docs, "date", "date")
+
+
+async def refresh_roster_for_leaves(leaves):
+    """refresh ช่วงวันลาของใบลาเหล่านี้ (รวมเป็นช่วงเดียวต่อ ipus + department)"""
+    await _refresh_windows(leaves, "start_date", "end_date")
+
+
+async def refresh_roster_for_leave(leave):
+    await refresh_roster_for_leaves([leave])
+
+
+async def rebuild_roster(ipus: str = None, department: str = None) -> int:
+    """สร้าง roster_days ใหม่ทั้งหมด (หรือเฉพาะ ipus + department); คืนจำนวนช่วงที่ refresh"""
+    scope = {"ipus": ipus, "department": department} if ipus and department else {}
+    await roster_collection.delete_many(scope)
+
+    windows = {}
+
+    shift_cursor = await shift_collection.aggregate([
+        {"$match": {**scope, "status": {"$ne": "rejected"}}},
+        {"$group": {
+            "_id": {"ipus": "$ipus", "department": "$department"},
+            "start": {"$min": "$date"},
+            "end": {"$max": "$date"}
+        }}
+    ])
+    leave_cursor = await leave_collection.aggregate([
+        {"$match": {**scope, "status": "matched", "shifts_materialized": {"$ne": True}}},
+        {"$group": {
+            "_id": {"ipus": "$ipus", "department": "$department"},
+            "start": {"$min": "$start_date"},
+            "end": {"$max": "$end_date"}
+        }}
+    ])
+
+    for cursor in (shift_cursor, leave_cursor):
+        async for group in cursor:
+            key = (group["_id"].get("ipus"), group["_id"].get("department"))
+            start, end = str(group["start"]), str(group["end"])
+            if key in windows:
+                start, end = min(start, windows[key][0]), max(end, windows[key][1])
+            windows[key] = (start, end)
+
+    for (ipus, department), (start, end) in windows.items():
+        await refresh_roster(ipus, department, start, end)
+    return len(windows)
+
+
+async def _main(args):
+    if args and args[0] == "rebuild" and len(args) in (1, 3):
+        count = await rebuild_roster(*args[1:])
+        print(f"roster_days: rebuilt {count} ipus/department range(s)")
+    else:
+        raise SystemExit("usage: python -m api.services.roster rebuild [ipus department]")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+"""
+Session store ของบทสนทนา LINE (line_sessions)
+
+ทุก operation เป็น round-trip เดียว:
+- load:        โหลด session หรือสร้างใหม่ (state = idle) ด้วย find_one_and_update + upsert
+- transition:  เปลี่ยน state/context แล้วคืน session ล่าสุด
+
+backend เลือกด้วย SESSION_STORE_BACKEND: "mongo" (ค่าเริ่มต้น) หรือ "memory" (ทดสอบ / benchmark)
+"""
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+
+from api.core.config import SESSION_STORE_BACKEND, SESSION_TTL_SECONDS
+from api.core.database import session_collection
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    async def load(self, user_id: str) -> dict:
+        ...
+
+    @abstractmethod
+    async def transition(self, user_id: str, state: str, context: dict = None) -> dict:
+        ...
+
+    @abstractmethod
+    async def transition_many(self, contexts: dict, state: str, session=None):
+        """เปลี่ยน state ของหลาย user พร้อมกัน; contexts = {user_id: context}, session = transaction ของผู้เรียก"""
+
+
+class MongoSessionStore(SessionStore):
+    """session หมดอายุด้วย TTL index บน updated_at (ดู api/core/indexes.py)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def load(self, user_id: str) -> dict:
+        return await self.collection.find_one_and_update(
+            {"user_id": user_id},
+            {
+                "$setOnInsert": {"state": "idle", "context": {}},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def transition(self, user_id: str, state: str, context: dict = None) -> dict:
+        return await self.collection.find_one_and_update(
+            {"user_id": user_id},
+            {
+                "$set": {
+                    "state": state,
+                    "context": context or {},
+                    "updated_at": datetime.utcnow()
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def transition_many(self, contexts: dict, state: str, session=None):
+        if not contexts:
+            return
+
+        now = datetime.utcnow()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id},
+                {
+                    "$set": {
+                        "state": state,
+                        "context": context or {},
+                        "updated_at": now
+                    }
+                },
+                upsert=True
+            )
+            for user_id, context in contexts.items()
+        ], ordered=False, session=session)
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._sessions = {}
+
+    def _save(self, user_id: str, state: str, context: dict) -> dict:
+        session = {
+            "user_id": user_id,
+            "state": state,
+            "context": context or {},
+            "updated_at": datetime.utcnow()
+        }
+        self._sessions[user_id] = (time.monotonic(), session)
+        return dict(session)
+
+    async def load(self, user_id: str) -> dict:
+        touched, session = self._sessions.get(user_id, (None, None))
+        if session is None or time.monotonic() - touched > self.ttl:
+            return self._save(user_id, "idle", {})
+        return self._save(user_id, session["state"], session["context"])
+
+    async def transition(self, user_id: str, state: str, context: dict = None) -> dict:
+        return self._save(user_id, state, context)
+
+    async def transition_many(self, contexts: dict, state: str, session=None):
+        for user_id, context in contexts.items():
+            self._save(user_id, state, context)
+
+
+def create_session_store(backend: str = SESSION_STORE_BACKEND) -> SessionStore:
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "mongo":
+        return MongoSessionStore(session_collection)
+    raise ValueError(f"Unknown session store backend: {backend}")
+
+
+session_store = create_session_store()
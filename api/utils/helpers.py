@@ -1,3 +1,6 @@
+from datetime import date, datetime, timedelta
+
+
 def doctor_helper(doc):
     doc["_id"] = str(doc["_id"])
     return doc
@@ -8,3 +11,71 @@ def department_helper(doc):
         "department": doc.get("department"),
         "sub_departments": doc.get("sub_departments", [])
     }
+
+
+def iter_days(start: date, end: date):
+    """yield ทุกวันตั้งแต่ start ถึง end (รวมทั้งสองวัน)"""
+    d = start
+    one_day = timedelta(days=1)
+    while d <= end:
+        yield d
+        d += one_day
+
+
+def clip_days(start: date, end: date, window_start: date, window_end: date):
+    """วันใน start..end ที่อยู่ในช่วง window_start..window_end เท่านั้น"""
+    return iter_days(max(start, window_start), min(end, window_end))
+
+
+# field วันที่แบบ BSON date ใช้ใน query / index เท่านั้น ไม่ส่งออกใน response (ใช้เป็น projection)
+SHIFT_NATIVE_DATES_HIDDEN = {"date_on": 0}
+LEAVE_NATIVE_DATES_HIDDEN = {"start_on": 0, "end_on": 0}
+
+
+def to_bson_date(value) -> datetime:
+    """'YYYY-MM-DD' / date → datetime เที่ยงคืน UTC (เก็บเป็น BSON date คู่กับ field string เดิม)"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return datetime(value.year, value.month, value.day)
+
+
+def doc_day(doc: dict, native_field: str, text_field: str) -> date:
+    """วันที่ของ document: ใช้ BSON date ถ้ามี ไม่งั้น parse string เดิม (ข้อมูลที่ยังไม่ migrate)"""
+    value = doc.get(native_field)
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(doc[text_field]))
+
+
+def dual_date_query(native_field: str, native: dict, legacy: dict) -> dict:
+    """
+    เงื่อนไขวันที่ที่อ่านได้ทั้งข้อมูลใหม่ (BSON date) และข้อมูลที่ยังไม่ migrate (string)
+    native / legacy คือเงื่อนไขชุดเดียวกันบน field ใหม่ / field เดิม
+    """
+    return {"$or": [
+        native,
+        {native_field: {"$exists": False}, **legacy}
+    ]}
+
+
+def build_projection(fields, model, presets=None):
+    """
+    แปลง ?fields=a,b,preset เป็น Mongo projection
+    ชื่อ field ตรวจกับ model (รวม alias เช่น _id); ชื่อ preset จะถูกแตกเป็น field ของมัน
+    คืน None ถ้าไม่ได้ระบุ fields (= ทั้ง document)
+    """
+    if not fields:
+        return None
+
+    presets = presets or {}
+    allowed = {f.alias or name for name, f in model.model_fields.items()}
+
+    projection = {}
+    for name in (f.strip() for f in fields.split(",")):
+        if not name:
+            continue
+        for field in presets.get(name, [name]):
+            if field not in allowed:
+                raise ValueError(f"Unknown field: {field}")
+            projection[field] = 1
+    return projection or None
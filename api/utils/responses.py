@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+
+from api.core.config import HTTP_CACHE_S_MAXAGE, HTTP_CACHE_STALE_WHILE_REVALIDATE
+
+
+def cache_control():
+    # max-age=0: browser ต้อง revalidate ด้วย If-None-Match ทุกครั้ง
+    # s-maxage: ให้ edge ของ Vercel cache ได้ (ปิดไว้ถ้าเป็น 0)
+    if HTTP_CACHE_S_MAXAGE <= 0:
+        return "public, max-age=0, must-revalidate"
+    return (
+        f"public, max-age=0, s-maxage={HTTP_CACHE_S_MAXAGE}, "
+        f"stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+    )
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = (t.strip() for t in header.split(","))
+    return etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def etag_response(request: Request, payload) -> Response:
+    """
+    serialize payload เป็น JSON แล้วแนบ strong ETag (hash ของ body)
+    ถ้า If-None-Match ตรงกัน → 304 ไม่มี body
+    """
+    body = json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control()}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def ndjson_response(cursor) -> StreamingResponse:
+    """
+    stream document จาก Mongo cursor ออกไปทีละบรรทัด (application/x-ndjson)
+    ไม่ต้องสร้าง list ทั้งก้อนไว้ใน memory ก่อน
+    """
+    async def lines():
+        async for doc in cursor:
+            if "_id" in doc:
+                doc["_id"] = str(doc["_id"])
+            yield json.dumps(jsonable_encoder(doc), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
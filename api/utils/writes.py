@@ -0,0 +1,54 @@
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+
+async def insert_and_return(collection, doc: dict) -> dict:
+    """insert แล้วคืน document ที่สร้างเองในเครื่อง (insert_one ใส่ _id ให้ doc) ไม่ต้อง find_one ซ้ำ"""
+    await collection.insert_one(doc)
+    return doc
+
+
+async def update_and_return(collection, query: dict, update: dict, projection=None):
+    """update แล้วคืน document หลังแก้ใน round-trip เดียว; ไม่พบ → None"""
+    return await collection.find_one_and_update(
+        query,
+        update,
+        projection=projection,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def update_many_by_ids(collection, ids, update, projection=None, unless=None):
+    """
+    update_many กับ _id หลายตัวใน round-trip เดียว (อ่าน _id ที่มีอยู่ก่อนเพื่อรายงานตัวที่ไม่พบ)
+    unless = {field: value}: document ที่มีค่านี้อยู่แล้ว (เช่น status เดียวกับที่จะตั้ง) ไม่ถูกแก้
+    คืน (summary, docs) โดย docs คือ document ก่อนแก้ (ตาม projection) ของตัวที่จะถูกแก้เท่านั้น
+    """
+    ids = list(dict.fromkeys(ids))
+    object_ids = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+    unless = unless or {}
+
+    docs = await collection.find(
+        {"_id": {"$in": object_ids}},
+        {**(projection or {"_id": 1}), **{field: 1 for field in unless}}
+    ).to_list() if object_ids else []
+    found = {str(d["_id"]) for d in docs}
+
+    docs = [d for d in docs if any(d.get(f) != v for f, v in unless.items())] if unless else docs
+
+    modified = 0
+    if docs:
+        # $nor ซ้ำฝั่ง server: ตัวที่ถูกแก้เป็นค่านั้นระหว่าง find กับ update ก็ไม่ถูกนับว่าแก้
+        result = await collection.update_many(
+            {"_id": {"$in": [d["_id"] for d in docs]}, **({"$nor": [unless]} if unless else {})},
+            update
+        )
+        modified = result.modified_count
+
+    summary = {
+        "matched": len(found),
+        "modified": modified,
+        "unchanged": len(found) - len(docs),
+        "not_found": [i for i in ids if i not in found]
+    }
+    return summary, docs
@@ -0,0 +1,77 @@
+"""Collection / index ปลอมสำหรับ test ที่ไม่ต้องมี MongoDB จริง"""
+import asyncio
+import copy
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self._docs:
+            yield doc
+
+    async def to_list(self, length=None):
+        return list(self._docs)
+
+
+class FakeFindCollection:
+    """find() คืนทุก document ที่เก็บไว้ (test ส่งเฉพาะ document ที่ query ควรเจอ)"""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+
+    def find(self, *args, **kwargs):
+        return FakeCursor(dict(d) for d in self.docs)
+
+
+class FakeDoctorIndex:
+    def __init__(self, identities):
+        self.identities = {i.id: i for i in identities}
+
+    async def get(self, doctor_id):
+        return self.identities.get(doctor_id)
+
+    async def get_many(self, doctor_ids):
+        return {i: self.identities[i] for i in set(doctor_ids) if i in self.identities}
+
+
+class FakeClaimCollection:
+    """
+    ใบลาใบเดียว ทำเฉพาะรูป query ที่ claim_replacement ใช้ โดยตรวจเงื่อนไขและเขียนใน step เดียว
+    (เหมือน MongoDB ที่ update document เดียวแบบ atomic) แต่ yield ก่อนทุก call ให้ coroutine สลับกันได้
+    """
+
+    def __init__(self, leave):
+        self.leave = leave
+
+    async def find_one_and_update(self, query, update, array_filters=None, return_document=None):
+        await asyncio.sleep(0)
+        leave = self.leave
+        if query["_id"] != leave["_id"]:
+            return None
+        if query["status"] != leave["status"]:
+            return None
+
+        wanted = query["replacement_doctors"]["$elemMatch"]
+        if not any(all(d.get(k) == v for k, v in wanted.items()) for d in leave["replacement_doctors"]):
+            return None
+        if any(d["status"] in query["replacement_doctors.status"]["$nin"] for d in leave["replacement_doctors"]):
+            return None
+
+        me = {k.split(".", 1)[1]: v for k, v in array_filters[0].items()}
+        for field, value in update["$set"].items():
+            if field == "replacement_doctors.$[me].status":
+                for d in leave["replacement_doctors"]:
+                    if all(d.get(k) == v for k, v in me.items()):
+                        d["status"] = value
+            else:
+                leave[field] = value
+        return copy.deepcopy(leave)
+
+    async def find_one(self, query, projection=None):
+        await asyncio.sleep(0)
+        return copy.deepcopy(self.leave) if query["_id"] == self.leave["_id"] else None
@@ -0,0 +1,99 @@
+import asyncio
+import timeit
+from datetime import date, timedelta
+
+import pytest
+from bson import ObjectId
+
+from api.services import roster
+from api.services.doctor_index import DoctorIdentity
+from api.utils.helpers import clip_days
+from tests.fakes import FakeDoctorIndex, FakeFindCollection
+
+WINDOW_START = date(2026, 3, 1)
+WINDOW_END = date(2026, 3, 7)
+
+
+def leave_around_window(length: int):
+    """ใบลายาว length วัน ที่ครอบ window 7 วันไว้ตรงกลาง (หรืออยู่ในวันแรกของ window ถ้าสั้นกว่า)"""
+    start = WINDOW_START - timedelta(days=max(0, (length - 7) // 2))
+    return start, start + timedelta(days=length - 1)
+
+
+# -------------------------
+# boundaries
+# -------------------------
+def test_leave_inside_window():
+    days = list(clip_days(date(2026, 3, 2), date(2026, 3, 3), WINDOW_START, WINDOW_END))
+    assert days == [date(2026, 3, 2), date(2026, 3, 3)]
+
+
+def test_leave_fully_outside_window():
+    assert list(clip_days(date(2026, 2, 1), date(2026, 2, 28), WINDOW_START, WINDOW_END)) == []
+    assert list(clip_days(date(2026, 3, 8), date(2026, 3, 20), WINDOW_START, WINDOW_END)) == []
+
+
+def test_partial_overlap_is_clipped_to_intersection():
+    before = list(clip_days(date(2026, 2, 25), date(2026, 3, 2), WINDOW_START, WINDOW_END))
+    after = list(clip_days(date(2026, 3, 6), date(2026, 3, 12), WINDOW_START, WINDOW_END))
+    assert before == [date(2026, 3, 1), date(2026, 3, 2)]
+    assert after == [date(2026, 3, 6), date(2026, 3, 7)]
+
+
+def test_window_end_before_window_start_is_empty():
+    assert list(clip_days(date(2026, 1, 1), date(2026, 12, 31), WINDOW_END, WINDOW_START)) == []
+
+
+# -------------------------
+# cost: ขึ้นกับขนาด window ไม่ใช่ความยาวใบลา
+# -------------------------
+@pytest.mark.parametrize("length", [1, 365, 3650])
+def test_days_are_bounded_by_window(length):
+    start, end = leave_around_window(length)
+    days = list(clip_days(start, end, WINDOW_START, WINDOW_END))
+    assert len(days) == min(length, 7)
+    assert all(WINDOW_START <= d <= WINDOW_END for d in days)
+
+
+def test_cost_is_constant_in_leave_length():
+    def cost(length):
+        start, end = leave_around_window(length)
+        return min(timeit.repeat(
+            lambda: list(clip_days(start, end, WINDOW_START, WINDOW_END)),
+            number=2000,
+            repeat=5
+        ))
+
+    timings = {length: cost(length) for length in (1, 365, 3650)}
+
+    # แตกทั้งช่วงลาจะช้ากว่า ~500 เท่าที่ 3650 วัน; clip แล้วต่างกันแค่จำนวนวันใน window (1 vs 7)
+    assert timings[3650] < timings[365] * 3
+    assert timings[3650] < timings[1] * 10
+
+
+def test_build_shift_table_expands_only_window_days(monkeypatch):
+    start, end = leave_around_window(3650)
+    leave = {
+        "_id": ObjectId(),
+        "doctor_id": "leaving-doctor",
+        "ipus": "ipus",
+        "department": "med",
+        "sub_department": "ward",
+        "shift_name": "night",
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "status": "matched",
+        "accepted_by": {"doctor_id": "replacement-doctor"}
+    }
+    monkeypatch.setattr(roster, "shift_collection", FakeFindCollection())
+    monkeypatch.setattr(roster, "leave_collection", FakeFindCollection([leave]))
+    monkeypatch.setattr(roster, "doctor_index", FakeDoctorIndex([DoctorIdentity(id="replacement-doctor")]))
+
+    rows = asyncio.run(roster.build_shift_table(
+        "ipus", "med", WINDOW_START.isoformat(), WINDOW_END.isoformat()
+    ))
+
+    assert [r["date"] for r in rows] == [
+        (WINDOW_START + timedelta(days=i)).isoformat() for i in range(7)
+    ]
+    assert all(r["replacement"] and r["doctor_id"] == "replacement-doctor" for r in rows)
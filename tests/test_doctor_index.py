@@ -0,0 +1,73 @@
+"""
+incremental refresh ต้องไม่ข้าม update จาก instance อื่น
+watermark ขยับจาก document ที่อ่านจาก Mongo เท่านั้น (ไม่ใช่จาก put ของ write ใน process นี้)
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from api.services.doctor_index import DoctorIdentityIndex
+from tests.fakes import FakeCursor
+
+T0 = datetime(2026, 3, 1, 8, 0, 0)
+
+
+class FakeDoctors:
+    """find ตาม {"updated_at": {"$gt": t}} / {"$exists": True} / {} และจำ query ที่ถูกถาม"""
+
+    def __init__(self, docs):
+        self.docs = {d["_id"]: dict(d) for d in docs}
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        since = query.get("updated_at", {}).get("$gt")
+        return FakeCursor(
+            dict(d) for d in self.docs.values()
+            if since is None or d["updated_at"] > since
+        )
+
+
+def make_index(collection, overlap_seconds=5):
+    # refresh ทุกครั้งที่ใช้ แต่ไม่ full reload ระหว่าง test
+    return DoctorIdentityIndex(collection, refresh_seconds=0, full_reload_seconds=3600,
+                               refresh_overlap_seconds=overlap_seconds)
+
+
+def test_local_put_does_not_hide_earlier_remote_update():
+    remote, local = ObjectId(), ObjectId()
+    doctors = FakeDoctors([
+        {"_id": remote, "line_id": "old", "updated_at": T0},
+        {"_id": local, "line_id": "a", "updated_at": T0},
+    ])
+    index = make_index(doctors, overlap_seconds=0)
+
+    async def run():
+        await index.get(str(remote))
+
+        # instance อื่นแก้ remote ที่ T0+10s; process นี้เพิ่งเขียน local ที่ T0+60s
+        doctors.docs[remote].update(line_id="new", updated_at=T0 + timedelta(seconds=10))
+        local_doc = {"_id": local, "line_id": "b", "updated_at": T0 + timedelta(seconds=60)}
+        doctors.docs[local] = local_doc
+        index.put(local_doc)
+
+        return await index.get(str(remote))
+
+    assert asyncio.run(run()).line_id == "new"
+
+
+def test_refresh_overlap_absorbs_clock_skew():
+    doctor, skewed = ObjectId(), ObjectId()
+    doctors = FakeDoctors([{"_id": doctor, "line_id": "a", "updated_at": T0}])
+    index = make_index(doctors, overlap_seconds=5)
+
+    async def run():
+        await index.get(str(doctor))
+        # instance ที่นาฬิกาช้า 2 วินาทีเขียนหลัง refresh แต่ updated_at เก่ากว่า watermark
+        doctors.docs[skewed] = {"_id": skewed, "line_id": "late", "updated_at": T0 - timedelta(seconds=2)}
+        await index.get(str(doctor))
+        return index._by_line.get("late")
+
+    assert asyncio.run(run()) is not None
+    assert doctors.queries[-1] == {"updated_at": {"$gt": T0 - timedelta(seconds=5)}}
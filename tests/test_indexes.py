@@ -0,0 +1,40 @@
+import asyncio
+
+from pymongo.errors import OperationFailure
+
+from api.core import indexes
+
+
+class FakeIndexCollection:
+    """create_indexes ล้มเฉพาะ index ที่อยู่ใน failing"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    async def create_indexes(self, models):
+        names = [m.document["name"] for m in models]
+        for name in names:
+            if name in self.failing:
+                raise OperationFailure("E11000 duplicate key", 11000, {"errmsg": f"duplicate key: {name}"})
+        return names
+
+
+def test_one_failing_index_does_not_take_down_the_others(monkeypatch):
+    collections = {
+        indexes.COLLECTIONS["line_sessions"]: FakeIndexCollection(failing={"user_id_1_unique"})
+    }
+    monkeypatch.setattr(indexes, "db", _FakeDb(collections))
+
+    results = asyncio.run(indexes.ensure_indexes())
+
+    assert results["line_sessions"]["created"] == ["updated_at_1"]
+    assert results["line_sessions"]["errors"] == {"user_id_1_unique": "duplicate key: user_id_1_unique"}
+    assert indexes.index_errors(results) == ["line_sessions.user_id_1_unique: duplicate key: user_id_1_unique"]
+
+
+class _FakeDb:
+    def __init__(self, collections):
+        self.collections = collections
+
+    def __getitem__(self, name):
+        return self.collections.get(name) or FakeIndexCollection()
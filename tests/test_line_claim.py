@@ -0,0 +1,132 @@
+"""
+หลายคนตอบ OK พร้อมกันกับใบลาเดียว → ต้องมีผู้ชนะคนเดียว (claim ด้วย find_one_and_update แบบมีเงื่อนไข)
+LINE OK กับ POST /leaves/{id}/confirm ใช้ claim_replacement ตัวเดียวกัน จึงชนกันเองก็ต้องได้ผู้ชนะคนเดียว
+"""
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from api.routers import leaves as leaves_router, line
+from api.services import replacements
+from api.services.doctor_index import DoctorIdentity
+from api.services.session_store import InMemorySessionStore
+from tests.fakes import FakeClaimCollection, FakeDoctorIndex
+
+N = 20
+
+
+def setup_claim(monkeypatch, doctors, status="waiting_replacement"):
+    leave_id = ObjectId()
+    leaves = FakeClaimCollection({
+        "_id": leave_id,
+        "status": status,
+        "replacement_doctors": [{"doctor_id": d, "status": "pending"} for d in doctors]
+    })
+    sessions = InMemorySessionStore()
+    materialized = []
+
+    async def fake_materialize(leave, doctor_id):
+        materialized.append(doctor_id)
+        return 1
+
+    monkeypatch.setattr(replacements, "leave_collection", leaves)
+    monkeypatch.setattr(line, "session_store", sessions)
+    monkeypatch.setattr(line, "materialize_replacement_shifts", fake_materialize)
+    return leave_id, leaves, sessions, materialized
+
+
+def reply_ok(doctor, replies):
+    return line._handle_event({"source": {"userId": f"line-{doctor}"}, "message": {"text": "OK"}}, replies)
+
+
+def test_simultaneous_ok_has_exactly_one_winner(monkeypatch):
+    doctors = [f"doctor-{i}" for i in range(N)]
+    leave_id, leaves, sessions, materialized = setup_claim(monkeypatch, doctors)
+
+    async def run():
+        await sessions.transition_many({
+            f"line-{d}": {"leave_id": str(leave_id), "doctor_id": d, "doctor_name": d}
+            for d in doctors
+        }, "waiting_accept_leave")
+
+        replies = [[] for _ in doctors]
+        await asyncio.gather(*(reply_ok(d, replies[i]) for i, d in enumerate(doctors)))
+        return replies
+
+    replies = asyncio.run(run())
+    flat = [r for rs in replies for r in rs]
+
+    assert flat.count("✅ รับเวรสำเร็จ") == 1
+    assert flat.count("มีคนรับเวรไปแล้ว") == N - 1
+
+    matched = [d for d in leaves.leave["replacement_doctors"] if d["status"] == "matched"]
+    assert len(matched) == 1
+    assert leaves.leave["status"] == "matched"
+    assert leaves.leave["accepted_by"]["doctor_id"] == matched[0]["doctor_id"]
+    assert materialized == [matched[0]["doctor_id"]]
+
+    # ทุกคนกลับไป idle ไม่ว่าจะชนะหรือแพ้
+    states = [asyncio.run(sessions.load(f"line-{d}"))["state"] for d in doctors]
+    assert set(states) == {"idle"}
+
+
+def test_ok_on_rejected_leave_stays_unclaimed(monkeypatch):
+    leave_id, leaves, sessions, materialized = setup_claim(monkeypatch, ["late"], status="rejected")
+
+    async def run():
+        await sessions.transition("line-late", "waiting_accept_leave", {
+            "leave_id": str(leave_id), "doctor_id": "late", "doctor_name": "late"
+        })
+        replies = []
+        await reply_ok("late", replies)
+        return replies
+
+    assert asyncio.run(run()) == ["รายการนี้ปิดแล้ว"]
+    assert leaves.leave["status"] == "rejected"
+    assert "accepted_by" not in leaves.leave
+    assert [d["status"] for d in leaves.leave["replacement_doctors"]] == ["pending"]
+    assert materialized == []
+
+
+@pytest.mark.parametrize("confirm_first", [True, False])
+def test_confirm_and_line_ok_on_same_leave_have_one_winner(monkeypatch, confirm_first):
+    leave_id, leaves, sessions, materialized = setup_claim(monkeypatch, ["web", "chat"])
+
+    async def fake_materialize(leave, doctor_id):
+        materialized.append(doctor_id)
+        return 1
+
+    monkeypatch.setattr(leaves_router, "materialize_replacement_shifts", fake_materialize)
+    monkeypatch.setattr(leaves_router, "doctor_index", FakeDoctorIndex([DoctorIdentity(id="web")]))
+
+    async def confirm():
+        try:
+            return await leaves_router.confirm_replacement(str(leave_id), "web")
+        except HTTPException as e:
+            return e.status_code
+
+    async def run():
+        await sessions.transition("line-chat", "waiting_accept_leave", {
+            "leave_id": str(leave_id), "doctor_id": "chat", "doctor_name": "chat"
+        })
+        replies = []
+        if confirm_first:
+            confirmed, _ = await asyncio.gather(confirm(), reply_ok("chat", replies))
+        else:
+            _, confirmed = await asyncio.gather(reply_ok("chat", replies), confirm())
+        return confirmed, replies
+
+    confirmed, replies = asyncio.run(run())
+    winner = "web" if confirm_first else "chat"
+
+    assert leaves.leave["status"] == "matched"
+    assert leaves.leave["accepted_by"]["doctor_id"] == winner
+    assert [d["doctor_id"] for d in leaves.leave["replacement_doctors"] if d["status"] == "matched"] == [winner]
+    # ผู้แพ้ต้องไม่ได้ materialize (ไม่งั้น delete_many ของเขาจะลบ shift ของผู้ชนะ)
+    assert materialized == [winner]
+    if confirm_first:
+        assert confirmed == {"message": "confirmed"} and replies == ["มีคนรับเวรไปแล้ว"]
+    else:
+        assert confirmed == 409 and replies == ["✅ รับเวรสำเร็จ"]
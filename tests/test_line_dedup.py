@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+
+from api.services import line_dedup
+
+
+class FlakyEventCollection:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.inserted = []
+
+    async def insert_one(self, doc):
+        outcome = self.outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+        self.inserted.append(doc["_id"])
+
+
+@pytest.fixture
+def dedup(monkeypatch):
+    monkeypatch.setattr(line_dedup, "_recent_events", line_dedup.LRUSet(100))
+    return line_dedup
+
+
+def event(event_id):
+    return {"webhookEventId": event_id, "deliveryContext": {"isRedelivery": False}}
+
+
+def test_first_delivery_is_claimed_and_remembered(dedup, monkeypatch):
+    monkeypatch.setattr(dedup, "line_event_collection", FlakyEventCollection(None))
+    assert asyncio.run(dedup.claim_event(event("e1"))) is True
+    # ส่งซ้ำมาที่ instance เดิม → LRU ตัดสินโดยไม่ถาม Mongo
+    assert asyncio.run(dedup.claim_event(event("e1"))) is False
+
+
+def test_duplicate_key_means_already_handled(dedup, monkeypatch):
+    monkeypatch.setattr(dedup, "line_event_collection", FlakyEventCollection(DuplicateKeyError("dup")))
+    assert asyncio.run(dedup.claim_event(event("e2"))) is False
+    assert "e2" in dedup._recent_events
+
+
+def test_failed_insert_does_not_block_redelivery(dedup, monkeypatch):
+    collection = FlakyEventCollection(AutoReconnect("failover"), None)
+    monkeypatch.setattr(dedup, "line_event_collection", collection)
+
+    with pytest.raises(AutoReconnect):
+        asyncio.run(dedup.claim_event(event("e3")))
+
+    assert asyncio.run(dedup.claim_event(event("e3"))) is True
+    assert collection.inserted == ["e3"]
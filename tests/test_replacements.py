@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from api.routers import leaves
+from api.services import replacements
+from api.services.doctor_index import DoctorIdentity
+from tests.fakes import FakeDoctorIndex
+
+
+class RecordingCollection:
+    def __init__(self, find_one_result=None):
+        self.calls = []
+        self.find_one_result = find_one_result
+
+    def _record(name):
+        async def call(self, *args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            if name == "insert_many":
+                return SimpleNamespace(inserted_ids=[d["_id"] for d in args[0]])
+            if name == "delete_many":
+                return SimpleNamespace(deleted_count=3)
+            if name == "find_one":
+                return self.find_one_result
+            return None
+        return call
+
+    insert_many = _record("insert_many")
+    delete_many = _record("delete_many")
+    update_one = _record("update_one")
+    update_many = _record("update_many")
+    find_one = _record("find_one")
+    find_one_and_update = _record("find_one_and_update")
+
+
+LEAVE = {
+    "_id": ObjectId(),
+    "doctor_id": "leaving",
+    "ipus": "ipus",
+    "department": "med",
+    "start_date": "2026-03-01",
+    "end_date": "2026-03-03",
+    "status": "matched"
+}
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    shifts, leave_collection = RecordingCollection(), RecordingCollection()
+    refreshed = []
+
+    async def refresh(leave):
+        refreshed.append(leave["_id"])
+
+    monkeypatch.setattr(replacements, "shift_collection", shifts)
+    monkeypatch.setattr(replacements, "leave_collection", leave_collection)
+    monkeypatch.setattr(replacements, "refresh_roster_for_leave", refresh)
+    monkeypatch.setattr(replacements, "doctor_index", FakeDoctorIndex([DoctorIdentity(id="replacement")]))
+    return SimpleNamespace(shifts=shifts, leaves=leave_collection, refreshed=refreshed)
+
+
+def test_materialize_writes_one_shift_per_day_and_drops_other_doctors(stubs):
+    inserted = asyncio.run(replacements.materialize_replacement_shifts(LEAVE, "replacement"))
+
+    assert inserted == 3
+    (delete, (delete_query,), _), (insert, (docs,), _) = stubs.shifts.calls
+    assert delete == "delete_many"
+    assert delete_query == {"leave_id": str(LEAVE["_id"]), "replacement": True, "doctor_id": {"$ne": "replacement"}}
+    assert insert == "insert_many"
+    assert [d["date"] for d in docs] == ["2026-03-01", "2026-03-02", "2026-03-03"]
+    assert {d["doctor_id"] for d in docs} == {"replacement"}
+    assert stubs.refreshed == [LEAVE["_id"]]
+
+
+def test_materialize_unknown_doctor_writes_nothing(stubs):
+    assert asyncio.run(replacements.materialize_replacement_shifts(LEAVE, "nobody")) is None
+    assert stubs.shifts.calls == []
+
+
+def test_remove_replacement_shifts_clears_flag(stubs):
+    assert asyncio.run(replacements.remove_replacement_shifts([LEAVE["_id"]])) == 3
+    (_, (query,), _), = stubs.shifts.calls
+    assert query == {"leave_id": {"$in": [str(LEAVE["_id"])]}, "replacement": True}
+    (_, (leave_query, update), _), = stubs.leaves.calls
+    assert leave_query == {"_id": {"$in": [LEAVE["_id"]]}}
+    assert update == {"$unset": {"shifts_materialized": ""}}
+
+
+@pytest.mark.parametrize("current", [
+    {**LEAVE, "accepted_by": {"doctor_id": "other"}},
+    {**LEAVE, "status": "rejected", "replacement_doctors": [{"doctor_id": "late", "status": "pending"}]},
+])
+def test_confirm_without_claim_is_409(monkeypatch, current):
+    # claim ไม่ผ่าน (แพทย์คนอื่นได้ไปแล้ว / ใบลาถูกปิด) แต่ใบลามีอยู่ → ไม่ materialize
+    leave_collection = RecordingCollection(find_one_result=current)
+    monkeypatch.setattr(replacements, "leave_collection", leave_collection)
+    monkeypatch.setattr(leaves, "doctor_index", FakeDoctorIndex([DoctorIdentity(id="late")]))
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(leaves.confirm_replacement(str(LEAVE["_id"]), "late"))
+    assert e.value.status_code == 409
+    (claim, (query, update), _), _ = leave_collection.calls
+    assert claim == "find_one_and_update"
+    assert query["status"] == "waiting_replacement"
+    assert update["$set"]["status"] == "matched"
+
+
+def test_confirm_unknown_doctor_is_404(monkeypatch):
+    monkeypatch.setattr(leaves, "doctor_index", FakeDoctorIndex([]))
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(leaves.confirm_replacement(str(LEAVE["_id"]), "nobody"))
+    assert e.value.status_code == 404
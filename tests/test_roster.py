@@ -0,0 +1,106 @@
+"""refresh_roster พร้อมกัน: snapshot ที่อ่านก่อนแต่เขียนทีหลังต้องไม่ทับ snapshot ใหม่กว่า (และ refresh แบบรวมช่วง)"""
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError
+
+from api.services import roster
+
+
+class FakeCounters:
+    def __init__(self):
+        self.seq = {}
+
+    async def find_one_and_update(self, query, update, upsert, return_document):
+        self.seq[query["_id"]] = self.seq.get(query["_id"], 0) + update["$inc"]["seq"]
+        return {"_id": query["_id"], "seq": self.seq[query["_id"]]}
+
+
+class FakeRosterDays:
+    """ReplaceOne(upsert) บน unique (ipus, department, date) + เงื่อนไข version {"$not": {"$gte": v}}"""
+
+    def __init__(self):
+        self.days = {}
+
+    async def bulk_write(self, ops, ordered):
+        errors = []
+        for i, op in enumerate(ops):
+            query, doc = op._filter, op._doc
+            key = (query["ipus"], query["department"], query["date"])
+            current = self.days.get(key)
+            if current is None or not current.get("version", 0) >= query["version"]["$not"]["$gte"]:
+                self.days[key] = doc
+            else:
+                errors.append({"index": i, "code": 11000, "errmsg": "duplicate key"})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+        return SimpleNamespace()
+
+
+def test_older_snapshot_written_last_does_not_win(monkeypatch):
+    days = FakeRosterDays()
+    monkeypatch.setattr(roster, "roster_collection", days)
+    monkeypatch.setattr(roster, "counter_collection", FakeCounters())
+
+    slow_read = asyncio.Event()
+    snapshots = iter([
+        # refresh แรก: อ่านก่อน write ที่สอง → ยังไม่เห็น shift B และค้างอยู่จนอีกตัวเขียนเสร็จ
+        ("old", [{"_id": "A", "date": "2026-03-01"}]),
+        ("new", [{"_id": "A", "date": "2026-03-01"}, {"_id": "B", "date": "2026-03-01"}]),
+    ])
+
+    async def build(ipus, department, start, end):
+        name, rows = next(snapshots)
+        if name == "old":
+            await slow_read.wait()
+        return rows
+
+    monkeypatch.setattr(roster, "build_shift_table", build)
+
+    async def run():
+        first = asyncio.create_task(roster.refresh_roster("i", "med", "2026-03-01", "2026-03-01"))
+        await asyncio.sleep(0)
+        await roster.refresh_roster("i", "med", "2026-03-01", "2026-03-01")
+        slow_read.set()
+        await first
+
+    asyncio.run(run())
+
+    day = days.days[("i", "med", "2026-03-01")]
+    assert [s["_id"] for s in day["slots"]] == ["A", "B"]
+    assert day["version"] == 2
+
+
+def test_empty_day_is_kept_as_tombstone(monkeypatch):
+    days = FakeRosterDays()
+    monkeypatch.setattr(roster, "roster_collection", days)
+    monkeypatch.setattr(roster, "counter_collection", FakeCounters())
+
+    async def build(*args):
+        return []
+
+    monkeypatch.setattr(roster, "build_shift_table", build)
+    asyncio.run(roster.refresh_roster("i", "med", "2026-03-01", "2026-03-02"))
+
+    assert {k[2]: v["slots"] for k, v in days.days.items()} == {"2026-03-01": [], "2026-03-02": []}
+
+
+def test_leaves_refresh_once_per_department(monkeypatch):
+    windows = []
+
+    async def refresh(ipus, department, start, end):
+        windows.append((ipus, department, start, end))
+
+    monkeypatch.setattr(roster, "refresh_roster", refresh)
+    asyncio.run(roster.refresh_roster_for_leaves([
+        {"ipus": "i", "department": "med", "start_date": "2026-03-05", "end_date": "2026-03-06"},
+        {"ipus": "i", "department": "med", "start_date": "2026-03-01", "end_date": "2026-03-02"},
+        {"ipus": "i", "department": "surg", "start_date": "2026-03-03", "end_date": "2026-03-03"},
+        {"ipus": "i", "department": "med", "start_date": None, "end_date": None},
+        None,
+    ]))
+
+    assert sorted(windows) == [
+        ("i", "med", "2026-03-01", "2026-03-06"),
+        ("i", "surg", "2026-03-03", "2026-03-03"),
+    ]
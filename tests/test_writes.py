@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from api.utils.writes import update_many_by_ids
+from tests.fakes import FakeCursor
+
+
+class FakeStatusCollection:
+    def __init__(self, docs):
+        self.docs = {d["_id"]: dict(d) for d in docs}
+
+    def find(self, query, projection):
+        ids = query["_id"]["$in"]
+        return FakeCursor(
+            {k: v for k, v in self.docs[i].items() if k == "_id" or k in projection}
+            for i in ids if i in self.docs
+        )
+
+    async def update_many(self, query, update):
+        skip = query.get("$nor", [])
+        matched = [
+            d for i, d in self.docs.items()
+            if i in query["_id"]["$in"] and not any(all(d.get(f) == v for f, v in c.items()) for c in skip)
+        ]
+        modified = 0
+        for d in matched:
+            changed = {f: v for f, v in update["$set"].items() if d.get(f) != v}
+            d.update(changed)
+            modified += bool(changed)
+        return SimpleNamespace(matched_count=len(matched), modified_count=modified)
+
+
+def test_docs_already_in_target_state_are_skipped_and_not_returned():
+    pending, approved = ObjectId(), ObjectId()
+    collection = FakeStatusCollection([
+        {"_id": pending, "status": "pending", "doctor_id": "a"},
+        {"_id": approved, "status": "approved", "doctor_id": "b"},
+    ])
+    missing = str(ObjectId())
+
+    summary, docs = asyncio.run(update_many_by_ids(
+        collection,
+        [str(pending), str(approved), missing, "not-an-id", str(pending)],
+        {"$set": {"status": "approved"}},
+        {"doctor_id": 1},
+        unless={"status": "approved"}
+    ))
+
+    assert summary == {"matched": 2, "modified": 1, "unchanged": 1, "not_found": [missing, "not-an-id"]}
+    assert [d["doctor_id"] for d in docs] == ["a"]
+    assert collection.docs[pending]["status"] == "approved"
+
+
+def test_resubmitting_a_batch_changes_nothing():
+    ids = [ObjectId(), ObjectId()]
+    collection = FakeStatusCollection([{"_id": i, "status": "pending"} for i in ids])
+
+    async def approve():
+        return await update_many_by_ids(
+            collection, [str(i) for i in ids], {"$set": {"status": "approved"}}, unless={"status": "approved"}
+        )
+
+    asyncio.run(approve())
+    summary, docs = asyncio.run(approve())
+
+    assert docs == []
+    assert summary["modified"] == 0 and summary["unchanged"] == 2